@@ -1,12 +1,29 @@
 import streamlit as st
+import streamlit.components.v1 as components
+from streamlit import runtime
 import numpy as np
 from PIL import Image
 import os
 import time
 import cv2
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
+from core.decoder import DecoderPool
+from core.detector import candidates_path, load_candidates, save_candidates
 from core.engine import FightStateEngine
+from core.events import HitEvent
+from core.frame_cache import FrameCache, FramePrefetcher, resize_to_width
+from core.frame_store import estimate_frame_store_bytes, frame_store_fits, frame_store_path, open_frame_store
 from core.renderer import SF6Renderer
+from core.jobs import RenderJobQueue
+from core.match_store import MatchStore
+from core.playback import build_playback_timeline, hud_layout
+from core.processor import apply_hud_state, build_hud_states
+from core.proxy import PLAYBACK_WIDTH, find_playback_proxy, find_proxy, proxy_width
+from core.thumbnails import compose_filmstrip, find_thumbnails, thumbnail_step
+from core.video_index import load_index
+from core.ffmpeg_utils import find_ffmpeg
 
 
 def init_session_state():
@@ -26,11 +43,14 @@ def init_session_state():
     if 'selected_video' not in st.session_state:
         st.session_state.selected_video = None
     
-    if 'video_cap' not in st.session_state:
-        st.session_state.video_cap = None
+    if 'frame_cache_mb' not in st.session_state:
+        st.session_state.frame_cache_mb = 512
     
-    if 'frame_cache' not in st.session_state:
-        st.session_state.frame_cache = {}
+    if 'proxy_preview' not in st.session_state:
+        st.session_state.proxy_preview = True
+    
+    if 'preview_renderer' not in st.session_state:
+        st.session_state.preview_renderer = None
     
     if 'video_width' not in st.session_state:
         st.session_state.video_width = 1920
@@ -64,50 +84,123 @@ def init_session_state():
     
     if 'p2_id' not in st.session_state:
         st.session_state.p2_id = "P2"
+    
+    if 'render_workers' not in st.session_state:
+        # 0 表示按队列的并发数均分 CPU
+        st.session_state.render_workers = 0
+    
+    if 'export_mode' not in st.session_state:
+        st.session_state.export_mode = 'video'
+    
+    if 'match_store' not in st.session_state:
+        st.session_state.match_store = None
+    
+    if 'binary_snapshot' not in st.session_state:
+        st.session_state.binary_snapshot = False
+    
+    if 'client_playback' not in st.session_state:
+        st.session_state.client_playback = True
+    
+    if 'player_nonce' not in st.session_state:
+        st.session_state.player_nonce = None
+    
+    if 'frame_store_full' not in st.session_state:
+        st.session_state.frame_store_full = False
 
 
-def get_cap():
-    cv2.setNumThreads(0)  # 禁用 OpenCV 多线程
-    
-    # 每次都创建新的 cap，避免多线程竞争
-    cap = cv2.VideoCapture(st.session_state.video_path)
-    if not cap.isOpened():
-        cap.release()
+@st.cache_resource
+def get_decoder_pool() -> DecoderPool:
+    # 跨 rerun、跨会话共享解码句柄，空闲句柄由后台线程定时关闭
+    return DecoderPool(handles_per_video=2, idle_timeout=60.0)
+
+
+@st.cache_resource
+def get_frame_cache() -> FrameCache:
+    # 同一视频的解码帧在所有会话间共享，按字节预算做 LRU 淘汰
+    return FrameCache(budget_bytes=512 * 1024 * 1024)
+
+
+@st.cache_resource
+def get_frame_stores() -> dict:
+    # 已打开的帧存储按文件路径在所有会话间共享，值为 (修改时间, FrameStore 或 None)
+    return {}
+
+
+def lookup_frame_store(stores: dict, video_path: str, width: Optional[int]):
+    # 每次只做一次 stat，帧存储被重新生成后按修改时间重新打开
+    path = frame_store_path(video_path, width)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
         return None
+    cached = stores.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, open_frame_store(video_path, width))
+        stores[path] = cached
+    return cached[1]
+
+
+def get_frame_store(video_path: str, width: Optional[int]):
+    return lookup_frame_store(get_frame_stores(), video_path, width)
+
+
+@st.cache_resource
+def get_frame_prefetcher() -> FramePrefetcher:
+    pool = get_decoder_pool()
+    stores = get_frame_stores()
     
-    return cap
+    # 预取线程里没有 Streamlit 上下文，只能使用这里捕获的对象
+    def load_frame(video_path: str, frame_idx: int, width: Optional[int]):
+        # 原分辨率帧存储里有这一帧时只需缩放，不经过解码器
+        store = lookup_frame_store(stores, video_path, None)
+        if store is not None and frame_idx < len(store):
+            return resize_to_width(np.asarray(store[frame_idx]), width)
+        
+        # 有全 I 帧的低分辨率代理文件时直接从代理解码，随机 seek 只需解一帧
+        source = (find_proxy(video_path, width) if width else None) or video_path
+        frame = pool.read(source, frame_idx)
+        if frame is None:
+            return None
+        return resize_to_width(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), width)
+    
+    return FramePrefetcher(get_frame_cache(), load_frame, radius=10)
+
 
+def preview_frame_width() -> Optional[int]:
+    # 界面按原宽度的 1/4 显示，代理模式下解码、缓存和 HUD 合成都在这个尺寸上进行；
+    # 与代理文件使用同一个取整后的宽度，代理帧才会按实际尺寸缓存和查找
+    if st.session_state.proxy_preview:
+        return proxy_width(int(st.session_state.video_width / 4))
+    return None
 
-def release_cap():
-    if 'video_cap' in st.session_state and st.session_state.video_cap is not None:
-        try:
-            st.session_state.video_cap.release()
-        except:
-            pass
-        st.session_state.video_cap = None
 
+def get_preview_renderer(width: int, height: int) -> SF6Renderer:
+    renderer = st.session_state.preview_renderer
+    if renderer is None or (renderer.width, renderer.height) != (width, height):
+        renderer = SF6Renderer(width=width, height=height, scale=width / st.session_state.video_width)
+        st.session_state.preview_renderer = renderer
+    return renderer
 
-def get_video_frame(video_path: str, frame_idx: int):
-    cache_key = f"{video_path}_{frame_idx}"
+
+def get_video_frame(video_path: str, frame_idx: int, width: Optional[int] = None):
+    # 同尺寸的帧存储直接返回零拷贝的只读切片，不占帧缓存也不需要预取
+    store = get_frame_store(video_path, width)
+    if store is not None and frame_idx < len(store):
+        return store[frame_idx]
     
-    if cache_key in st.session_state.frame_cache:
-        return st.session_state.frame_cache[cache_key]
+    cache = get_frame_cache()
+    prefetcher = get_frame_prefetcher()
+    key = (video_path, frame_idx, width)
     
-    cap = get_cap()
-    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
-    ret, frame = cap.read()
+    frame = cache.get(key)
+    if frame is None:
+        frame = prefetcher.loader(video_path, frame_idx, width)
+        if frame is None:
+            return None
+        cache.put(key, frame)
     
-    if ret:
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        st.session_state.frame_cache[cache_key] = rgb_frame
-        
-        if len(st.session_state.frame_cache) > 100:
-            st.session_state.frame_cache.pop(next(iter(st.session_state.frame_cache)))
-        
-        return rgb_frame
-    else:
-        release_cap()
-        return None
+    prefetcher.request(video_path, frame_idx, st.session_state.total_frames, width)
+    return frame
 
 
 def preview_raw_frame() -> Image.Image:
@@ -115,7 +208,7 @@ def preview_raw_frame() -> Image.Image:
         return Image.new('RGB', (1920, 1080), (20, 20, 20))
     
     frame_idx = st.session_state.current_frame
-    video_frame = get_video_frame(st.session_state.video_path, frame_idx)
+    video_frame = get_video_frame(st.session_state.video_path, frame_idx, preview_frame_width())
     
     if video_frame is not None:
         return Image.fromarray(video_frame)
@@ -123,46 +216,69 @@ def preview_raw_frame() -> Image.Image:
         return Image.new('RGB', (1920, 1080), (20, 20, 20))
 
 
-def render_preview_frame(time_pos: float) -> Image.Image:
+def frame_to_time(frame_idx: int) -> float:
+    # 帧与时间的唯一换算：第 n 帧的显示时间为 n / fps，浏览器端播放器（frameAt/seekFrame）与导出的状态表使用同一约定
+    return frame_idx / st.session_state.video_fps
+
+
+def time_to_frame(timestamp: float) -> int:
+    # 四舍五入，避免 n / fps * fps 的浮点误差落到上一帧
+    return int(round(timestamp * st.session_state.video_fps))
+
+
+def session_hud_states() -> np.ndarray:
+    # 预览、浏览器端播放与导出共用的逐帧 HUD 状态表，第 n 帧叠加第 n 行；事件、帧数和帧率不变时沿用上次的结果
     engine = st.session_state.engine
-    renderer = st.session_state.renderer
-    
-    engine.seek_to(time_pos)
+    n_frames = max(1, st.session_state.total_frames)
+    key = (engine.events_version, n_frames, st.session_state.video_fps)
+    cached = st.session_state.get('hud_states')
+    if cached is None or cached[0] is not engine or cached[1] != key:
+        cached = (engine, key, build_hud_states(engine.compute_timeline(n_frames, st.session_state.video_fps)))
+        st.session_state.hud_states = cached
+    return cached[2]
+
+
+def render_preview_frame(frame_idx: int) -> Image.Image:
+    states = session_hud_states()
+    state = states[min(max(0, frame_idx), len(states) - 1)]
     
-    state = engine.get_state()
-    shake_offset = state['shake']
+    width = preview_frame_width()
+    video_frame = None
+    if st.session_state.video_path:
+        video_frame = get_video_frame(st.session_state.video_path, frame_idx, width)
     
-    renderer.set_hp(1, engine.p1_hp_target, engine.p1_hp_display)
-    renderer.set_hp(2, engine.p2_hp_target, engine.p2_hp_display)
-    renderer.set_drive(1, int(engine.p1_drive))
-    renderer.set_drive(2, int(engine.p2_drive))
+    if video_frame is not None:
+        # 缓存中的帧不能被原地修改
+        frame = video_frame.copy()
+    else:
+        frame_width = width or st.session_state.video_width
+        frame_height = round(st.session_state.video_height * frame_width / st.session_state.video_width)
+        frame = np.full((frame_height, frame_width, 3), 20, dtype=np.uint8)
     
-    if st.session_state.video_path:
-        frame_idx = int(time_pos * st.session_state.video_fps)
-        video_frame = get_video_frame(st.session_state.video_path, frame_idx)
-        if video_frame is not None:
-            frame = Image.fromarray(video_frame).convert('RGB')
-        else:
-            frame = Image.new('RGB', (1920, 1080), (20, 20, 20))
+    if width is None:
+        renderer = st.session_state.renderer
+    else:
+        renderer = get_preview_renderer(frame.shape[1], frame.shape[0])
     
-    result = renderer.render(frame, st.session_state.p1_id, st.session_state.p2_id, shake_offset)
+    shake_offset = apply_hud_state(renderer, state)
+    renderer.composite_array(frame, st.session_state.p1_id, st.session_state.p2_id, shake_offset)
     
-    return result
+    return Image.fromarray(frame)
 
 
 def add_hit_event(player: int, damage: float, is_super: bool = False):
     engine = st.session_state.engine
-    current_time = st.session_state.current_frame / st.session_state.video_fps
+    current_time = frame_to_time(st.session_state.current_frame)
     
     engine.add_event(current_time, player, damage, is_super)
-    save_match_json()
+    journal_match_change(lambda store: store.log_add(HitEvent(current_time, player, damage, is_super)))
     st.toast(f"已添加事件: t={current_time:.2f}s, P{player} 攻击, 伤害={damage}", icon="✅")
     st.rerun()
 
 
 def jump_to_event(event_idx: int):
     event = st.session_state.engine.hit_events[event_idx]
-    frame_idx = int(event.timestamp * st.session_state.video_fps)
+    frame_idx = time_to_frame(event.timestamp)
     st.session_state.current_frame = min(st.session_state.total_frames - 1, max(0, frame_idx))
     st.rerun()
 
@@ -177,12 +293,57 @@ def delete_event(event_idx: int):
             st.warning(f"⚠️ 确认删除事件 #{event_idx + 1}? t={event.timestamp:.2f}s")
             return
         
-        del st.session_state.engine.hit_events[event_idx]
-        save_match_json()
+        st.session_state.engine.remove_event(event_idx)
+        journal_match_change(lambda store: store.log_delete(event_idx))
         st.toast("事件已删除", icon="🗑️")
         st.rerun()
 
 
+def load_hit_candidates(video_path: str) -> list:
+    # 检测任务在后台写文件，按修改时间判断是否需要重新读取
+    path = candidates_path(video_path)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return []
+    
+    cached = st.session_state.get('hit_candidates')
+    if cached is None or cached[0] != (path, mtime):
+        st.session_state.hit_candidates = ((path, mtime), load_candidates(path))
+    return st.session_state.hit_candidates[1]
+
+
+def pending_candidates(candidates: list, tolerance: float = 0.1) -> list:
+    # 已拒绝的、以及附近已有事件（视为已确认）的候选不再显示
+    events = st.session_state.engine.events
+    pending = []
+    for candidate in candidates:
+        if candidate.rejected:
+            continue
+        lo, hi = events.index_range(candidate.timestamp - tolerance, candidate.timestamp + tolerance)
+        if hi == lo:
+            pending.append(candidate)
+    return pending
+
+
+def thumbnail_markers() -> list:
+    # 事件在缩略图条下方标成攻击方的颜色（RGB）
+    events = st.session_state.engine.events
+    frames = [time_to_frame(timestamp) for timestamp in events.timestamps.tolist()]
+    return [(frame, (230, 60, 60) if player == 1 else (60, 120, 230)) for frame, player in zip(frames, events.players.tolist())]
+
+
+def jump_to_candidate(candidate):
+    st.session_state.current_frame = min(st.session_state.total_frames - 1, max(0, candidate.frame_idx))
+    st.rerun()
+
+
+def reject_candidate(candidates: list, candidate):
+    candidate.rejected = True
+    save_candidates(candidates_path(st.session_state.video_path), candidates)
+    st.rerun()
+
+
 def cancel_delete(event_idx: int):
     confirm_key = f"delete_confirm_{event_idx}"
     st.session_state[confirm_key] = False
@@ -205,66 +366,42 @@ def get_video_list() -> list[str]:
 
 
 def load_match_json(video_path: str):
-    import json
     video_name = os.path.splitext(os.path.basename(video_path))[0]
-    json_path = f"data/{video_name}.json"
-    
-    if os.path.exists(json_path):
-        try:
-            from core.engine import HitEvent
-            with open(json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                st.session_state.engine.hit_events = []
-                for event_data in data.get('hits', []):
-                    event = HitEvent(
-                        timestamp=event_data['timestamp'],
-                        player=event_data['player'],
-                        damage=event_data.get('damage', 10.0),
-                        is_super=event_data.get('is_super', False)
-                    )
-                    st.session_state.engine.hit_events.append(event)
-                st.success(f"已加载 {video_name}.json 的事件数据")
-        except Exception as e:
-            st.warning(f"加载 JSON 失败: {e}")
-
-
-def save_match_json(video_path: str = None):
-    import json
-    import shutil
-    
-    if not video_path and st.session_state.video_path:
-        video_path = st.session_state.video_path
-    
-    if not video_path:
+    store = MatchStore(f"data/{video_name}.json", 'binary' if st.session_state.binary_snapshot else 'json')
+    st.session_state.match_store = store
+    
+    try:
+        # 快照加上未合并的操作日志才是完整状态
+        st.session_state.engine.set_events(store.load())
+        if store.exists():
+            st.success(f"已加载 {video_name} 的事件数据")
+    except Exception as e:
+        st.warning(f"加载比赛数据失败: {e}")
+
+
+def journal_match_change(log_fn):
+    # 每次打点只追加一条日志记录，日志够长时才合并成完整快照
+    store = st.session_state.match_store
+    if store is None:
         return
     
-    video_name = os.path.splitext(os.path.basename(video_path))[0]
-    json_path = f"data/{video_name}.json"
-    
-    if os.path.exists(json_path):
-        backup_path = f"{json_path}.bak"
-        try:
-            shutil.copy2(json_path, backup_path)
-        except Exception as e:
-            pass
-    
-    events_data = {
-        "hits": [
-            {
-                "timestamp": event.timestamp,
-                "player": event.player,
-                "damage": event.damage,
-                "is_super": event.is_super
-            }
-            for event in st.session_state.engine.hit_events
-        ]
-    }
+    try:
+        log_fn(store)
+        if store.needs_compaction():
+            store.compact(st.session_state.engine.events)
+    except OSError as e:
+        st.warning(f"保存比赛数据失败: {e}")
+
+
+def save_match_json():
+    store = st.session_state.match_store
+    if store is None:
+        return
     
     try:
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(events_data, f, indent=2, ensure_ascii=False)
-    except Exception as e:
-        pass
+        store.export_json(st.session_state.engine.events)
+    except OSError as e:
+        st.warning(f"保存比赛数据失败: {e}")
 
 
 def load_video_info(video_path: str):
@@ -276,6 +413,13 @@ def load_video_info(video_path: str):
         height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         cap.release()
         
+        # CAP_PROP_FRAME_COUNT 来自容器头，可能不准；以索引扫描出的真实帧数为准
+        with st.spinner("正在建立关键帧索引..."):
+            index = load_index(video_path)
+        get_decoder_pool().set_index(video_path, index)
+        if index.frame_count > 0:
+            total_frames = index.frame_count
+        
         st.session_state.video_fps = fps
         st.session_state.total_frames = total_frames
         st.session_state.video_width = width
@@ -286,113 +430,197 @@ def load_video_info(video_path: str):
         if width != st.session_state.renderer.width or height != st.session_state.renderer.height:
             st.session_state.renderer = SF6Renderer(width=width, height=height)
         
-        st.info(f"视频信息: FPS={fps:.2f}, 总帧数={total_frames}, 分辨率={width}x{height}")
-        
+        st.info(f"视频信息: FPS={fps:.2f}, 总帧数={total_frames}, 关键帧={len(index.keyframes) or '未知'}, 分辨率={width}x{height}")
+    
     except Exception as e:
         st.error(f"读取视频信息失败: {e}")
 
 
-def export_rendered_video():
+@st.cache_resource
+def get_job_queue() -> RenderJobQueue:
+    # 进程级单例：刷新浏览器或切换会话不会中断后台渲染
+    return RenderJobQueue("output/jobs.json", max_concurrent=2)
+
+
+def export_output_path(video_name: str, mode: str) -> str:
+    return {
+        'video': f"output/{video_name}_rendered.mp4",
+        'png': f"output/{video_name}_hud",
+        'prores': f"output/{video_name}_hud.mov",
+        'rgba': f"output/{video_name}_hud.rgba"
+    }[mode]
+
+
+def submit_render_job():
     if not st.session_state.video_path or not st.session_state.engine.hit_events:
         st.error("请先上传视频并添加事件")
         return
     
-    import json
-    from moviepy.editor import VideoFileClip
-    from tqdm import tqdm
-    
     video_name = os.path.splitext(os.path.basename(st.session_state.video_path))[0]
-    output_path = f"output/{video_name}_rendered.mp4"
-    temp_path = "output/temp_render.mp4"
+    mode = st.session_state.export_mode
     
-    os.makedirs("output", exist_ok=True)
+    if mode in ('video', 'prores') and not find_ffmpeg():
+        st.warning("未找到 ffmpeg，将使用 OpenCV mp4v 编码且输出不含音轨" if mode == 'video' else "ProRes 输出需要 ffmpeg")
+        if mode == 'prores':
+            return
     
-    with st.spinner("正在渲染视频中...这可能需要几分钟"):
-        engine = st.session_state.engine
-        renderer = st.session_state.renderer
-        
-        engine.reset()
-        
-        cap = cv2.VideoCapture(st.session_state.video_path)
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        out = cv2.VideoWriter(temp_path, fourcc, fps, (width, height))
-        
-        progress_bar = st.progress(0)
-        
-        delta_time = 1.0 / fps
-        
-        for frame_idx in tqdm(range(total_frames), desc="渲染帧"):
-            engine.update(delta_time)
-            state = engine.get_state()
-            shake_offset = state['shake']
-            
-            renderer.set_hp(1, engine.p1_hp_target, engine.p1_hp_display)
-            renderer.set_hp(2, engine.p2_hp_target, engine.p2_hp_display)
-            renderer.set_drive(1, int(engine.p1_drive))
-            renderer.set_drive(2, int(engine.p2_drive))
-            
-            ret, frame = cap.read()
-            
-            if ret:
-                video_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                frame_image = Image.fromarray(video_frame).convert('RGB')
-            else:
-                frame_image = Image.new('RGB', (width, height), (20, 20, 20))
-            
-            result = renderer.render(frame_image, st.session_state.p1_id, st.session_state.p2_id, shake_offset)
-            
-            if result.mode == 'RGBA':
-                result = result.convert('RGB')
-            
-            result_frame = cv2.cvtColor(np.array(result), cv2.COLOR_RGB2BGR)
-            out.write(result_frame)
-            
-            if frame_idx % 30 == 0:
-                progress = frame_idx / total_frames
-                progress_bar.progress(progress)
-        
-        cap.release()
-        out.release()
-        
-        progress_bar.progress(0.9)
-        
-        try:
-            original_video = VideoFileClip(st.session_state.video_path)
-            audio = original_video.audio
-            
-            if audio is not None:
-                rendered_video = VideoFileClip(temp_path)
-                final_video = rendered_video.set_audio(audio)
-                final_video.write_videofile(output_path, codec='libx264', audio_codec='aac')
-                final_video.close()
-                rendered_video.close()
+    job_id = get_job_queue().submit(
+        st.session_state.video_path,
+        export_output_path(video_name, mode),
+        events=st.session_state.engine.events.to_dicts(),
+        match_json=f"data/{video_name}.json",
+        p1_id=st.session_state.p1_id,
+        p2_id=st.session_state.p2_id,
+        mode=mode,
+        workers=st.session_state.render_workers or None
+    )
+    st.toast(f"已提交渲染任务 {job_id}", icon="🚀")
+
+
+def render_jobs_panel():
+    queue = get_job_queue()
+    jobs = queue.list_jobs()
+    if not jobs:
+        st.caption("暂无渲染任务")
+        return
+    
+    status_labels = {
+        'queued': "⏳ 排队中",
+        'running': "🔄 渲染中",
+        'done': "✅ 已完成",
+        'failed': "❌ 失败",
+        'cancelled': "⏹️ 已取消"
+    }
+    
+    for job in jobs:
+        col_info, col_action = st.columns([4, 1])
+        with col_info:
+            st.write(f"{status_labels.get(job.status, job.status)} `{os.path.basename(job.video_path)}` → `{job.output_path}`")
+            if job.status == 'running':
+                st.progress(min(1.0, job.progress))
+            elif job.status == 'failed' and job.error:
+                st.caption(job.error.splitlines()[0])
+            elif job.status == 'done' and job.stats:
+                stage_labels = {'decode': "解码", 'composite': "合成", 'encode': "编码"}
+                parts = [f"{stage_labels.get(name, name)} {stage['fps']:.0f} fps" for name, stage in job.stats.items()]
+                composite = job.stats.get('composite', {})
+                if composite.get('cache_hits', 0) + composite.get('cache_misses', 0) > 0:
+                    parts.append(f"HUD 复用 {composite['hit_ratio']:.0%}")
+                st.caption(" | ".join(parts))
+                missing = job.stats.get('decode', {}).get('missing', 0)
+                if missing:
+                    st.warning(f"有 {missing} 帧读取失败，已用灰帧补齐")
+        with col_action:
+            if job.status in ('queued', 'running'):
+                if st.button("取消", key=f"job_cancel_{job.job_id}"):
+                    queue.cancel(job.job_id)
+                    st.rerun()
+            elif job.status in ('failed', 'cancelled'):
+                if st.button("重试", key=f"job_resume_{job.job_id}"):
+                    queue.resume(job.job_id)
+                    st.rerun()
             else:
-                import shutil
-                shutil.move(temp_path, output_path)
-            
-            original_video.close()
-            
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-        except Exception as e:
-            st.warning(f"音频处理失败: {e}")
-            import shutil
-            shutil.move(temp_path, output_path)
-        
-        progress_bar.progress(1.0)
+                if st.button("移除", key=f"job_remove_{job.job_id}"):
+                    queue.remove(job.job_id)
+                    st.rerun()
+
+
+# 有 fragment 支持时定时轮询任务进度，只刷新这一块
+_fragment = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None)
+if _fragment is not None:
+    render_jobs_panel = _fragment(run_every=2.0)(render_jobs_panel)
+
+
+# 缩略图条的格数
+FILMSTRIP_COLUMNS = 15
+
+# 浏览器端播放组件：纯静态 HTML，不需要前端构建
+fight_player = components.declare_component("fight_player", path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "player"))
+
+
+def media_url(data, mimetype: str, name: str) -> Optional[str]:
+    # 借用 st.video 背后的媒体文件服务（支持 Range 请求，浏览器可以直接 seek）；内容不变时 URL 不变，浏览器不会重复下载
+    try:
+        return runtime.get_instance().media_file_mgr.add(data, mimetype, f"fight_player.{name}")
+    except (AttributeError, RuntimeError):
+        return None
+
+
+@st.cache_resource
+def get_shared_media() -> dict:
+    # 浏览器端播放的视频按文件路径在所有会话间共享，值为 (修改时间, URL)
+    return {}
+
+
+def shared_media_url(path: str, mimetype: str) -> Optional[str]:
+    media = get_shared_media()
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = media.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    
+    # 在没有脚本上下文的线程里登记：文件不归属任何会话，rerun 结束时不会被当作孤儿删除，
+    # 之后的 rerun 也不必重新读取、哈希整个视频；文件重新生成后登记到同一坐标，旧内容随之释放
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        url = executor.submit(media_url, path, mimetype, f"video.{path}").result()
+    if url is not None:
+        media[path] = (mtime, url)
+    return url
+
+
+def playback_timeline_url(renderer: SF6Renderer) -> Optional[str]:
+    # HUD 状态表和血条宽度都没变时沿用上次打包的结果，不必每次 rerun 重算整条时间轴
+    states = session_hud_states()
+    cached = st.session_state.get('playback_timeline')
+    if cached is None or cached[0] is not states or cached[1] != renderer.bar_width:
+        cached = (states, renderer.bar_width, build_playback_timeline(states, renderer))
+        st.session_state.playback_timeline = cached
+    # 状态表只有几百 KB，每次 rerun 重新登记以保持当前会话的引用
+    return media_url(cached[2], 'application/octet-stream', 'timeline')
+
+
+def render_client_player(source: str, display_width: int) -> bool:
+    # 返回 False 表示媒体服务不可用，调用方退回服务端逐帧预览
+    renderer = st.session_state.renderer
+    video_url = shared_media_url(source, 'video/mp4')
+    timeline_url = playback_timeline_url(renderer)
+    if video_url is None or timeline_url is None:
+        return False
+    
+    message = fight_player(
+        video_url=video_url,
+        timeline_url=timeline_url,
+        layout=hud_layout(renderer, st.session_state.p1_id, st.session_state.p2_id),
+        fps=st.session_state.video_fps,
+        total_frames=st.session_state.total_frames,
+        frame=st.session_state.current_frame,
+        display_width=display_width,
+        show_ui=st.session_state.show_ui,
+        playback_speed=st.session_state.playback_speed,
+        key="fight_player",
+        default=None
+    )
     
-    st.success(f"视频渲染完成！保存路径: {output_path}")
-    st.video(output_path)
+    # 组件在每次 rerun 都返回最后一条消息，按 nonce 只处理一次
+    if message and message.get('nonce') != st.session_state.player_nonce:
+        st.session_state.player_nonce = message['nonce']
+        st.session_state.current_frame = min(st.session_state.total_frames - 1, max(0, int(message['frame'])))
+        if message.get('type') == 'hit':
+            player = int(message['player'])
+            add_hit_event(player, float(st.session_state.get(f"p{player}_damage", 10.0)),
+                          bool(st.session_state.get(f"p{player}_super_checkbox", False)))
+        st.rerun()
+    return True
 
 
 # 主视频播放区域
 def video_player_fragment():
     if st.session_state.video_path:
+        playback_source = find_playback_proxy(st.session_state.video_path) if st.session_state.client_playback else None
+        
         col_btn_1, col_btn_2, col_btn_3, col_btn_4, col_btn_5, col_btn_6 = st.columns([1, 1, 1, 1, 1, 2])
         
         with col_btn_1:
@@ -404,8 +632,13 @@ def video_player_fragment():
                 st.session_state.current_frame = max(0, st.session_state.current_frame - 1)
         
         with col_btn_3:
-            st.session_state.is_playing = st.toggle("⏯️ 播放" if not st.session_state.is_playing else "⏸️ 暂停", 
-                                                     value=st.session_state.is_playing, key="main_play_toggle")
+            if playback_source:
+                # 浏览器端播放时用播放器自带的控件，服务端不再逐帧 rerun
+                st.session_state.is_playing = False
+                st.caption("▶️ 见播放器")
+            else:
+                st.session_state.is_playing = st.toggle("⏯️ 播放" if not st.session_state.is_playing else "⏸️ 暂停", 
+                                                         value=st.session_state.is_playing, key="main_play_toggle")
         
         with col_btn_4:
             if st.button("+1 ▶️", use_container_width=True, key="main_btn_plus_1"):
@@ -427,7 +660,26 @@ def video_player_fragment():
             if st.session_state.is_playing:
                 st.session_state.is_playing = False
         
-        current_time = st.session_state.current_frame / st.session_state.video_fps
+        # 缩略图条：粗略浏览只读磁盘上的缩略图，不经过解码器；点“跳到此处”才解码选定的帧
+        thumb_step = thumbnail_step(st.session_state.video_fps)
+        thumbs = find_thumbnails(st.session_state.video_path, thumb_step)
+        if thumbs is not None:
+            markers = thumbnail_markers()
+            total_frames = st.session_state.total_frames
+            st.image(compose_filmstrip(thumbs, thumb_step, 0, total_frames, FILMSTRIP_COLUMNS, markers,
+                                       st.session_state.current_frame), use_container_width=True)
+            
+            thumb_idx = st.slider("缩略图浏览", 0, len(thumbs) - 1, min(len(thumbs) - 1, st.session_state.current_frame // thumb_step),
+                                  key="thumb_nav_slider")
+            target_frame = min(total_frames - 1, thumb_idx * thumb_step)
+            start_frame = max(0, (thumb_idx - FILMSTRIP_COLUMNS // 2) * thumb_step)
+            st.image(compose_filmstrip(thumbs, thumb_step, start_frame, start_frame + FILMSTRIP_COLUMNS * thumb_step,
+                                       FILMSTRIP_COLUMNS, markers, target_frame), use_container_width=True)
+            if st.button(f"跳到此处 ({frame_to_time(target_frame):.2f}s)", key="thumb_jump"):
+                st.session_state.current_frame = target_frame
+                st.rerun()
+        
+        current_time = frame_to_time(st.session_state.current_frame)
         st.write(f"⏱️ {current_time:.2f}s")
         
         st.session_state.show_ui = st.checkbox("显示 UI 叠加", value=st.session_state.show_ui, key="main_show_ui")
@@ -435,7 +687,10 @@ def video_player_fragment():
         # 计算显示宽度（原宽度的1/4）
         display_width = int(st.session_state.video_width / 4)
         
-        # 然后再显示视频
+        # 然后再显示视频；浏览器端播放只在暂停、拖动结束和打点时回传帧号
+        if playback_source and render_client_player(playback_source, display_width):
+            return
+        
         if st.session_state.is_playing and st.session_state.total_frames > 0:
             preview_img = preview_raw_frame()
             st.image(preview_img, width=display_width)
@@ -453,7 +708,7 @@ def video_player_fragment():
             st.rerun()
         else:
             if st.session_state.show_ui:
-                preview_img = render_preview_frame(st.session_state.current_frame / st.session_state.video_fps)
+                preview_img = render_preview_frame(st.session_state.current_frame)
             else:
                 preview_img = preview_raw_frame()
             st.image(preview_img, width=display_width)
@@ -524,25 +779,103 @@ def main():
         st.write(f"引擎 FPS: {st.session_state.engine.fps:.2f}")
         st.write(f"已添加事件数: {len(st.session_state.engine.hit_events)}")
         
+        store = st.session_state.match_store
+        binary_snapshot = st.checkbox("二进制快照（大量事件时加载更快）", value=st.session_state.binary_snapshot,
+                                      key="binary_snapshot_check")
+        if binary_snapshot != st.session_state.binary_snapshot:
+            st.session_state.binary_snapshot = binary_snapshot
+            if store is not None:
+                # 切换格式后立即按新格式合并一次，旧格式的快照代数落后，不会再被读取
+                store.snapshot_format = 'binary' if binary_snapshot else 'json'
+                save_match_json()
+        if store is not None:
+            st.caption(f"📝 未合并日志: {store.journal_records} 条")
+            if st.button("💾 合并并导出 JSON", key="export_match_json"):
+                save_match_json()
+                st.toast("已合并日志并写出比赛 JSON", icon="💾")
+        
         if st.button("重置引擎", key="reset_engine"):
             st.session_state.engine.reset()
             st.session_state.current_frame = 0
-            st.session_state.frame_cache = {}
-            release_cap()
+            if st.session_state.video_path:
+                get_frame_cache().clear(st.session_state.video_path)
+                get_decoder_pool().close(st.session_state.video_path)
             st.success("引擎和缓存已重置")
         
-        st.caption(f"📊 缓存: {len(st.session_state.frame_cache)} 帧 | 句柄: {'已释放' if st.session_state.video_cap is None else '已连接'}")
+        st.session_state.frame_cache_mb = st.number_input("帧缓存上限 (MB)", min_value=64, max_value=16384, step=64,
+                                                          value=st.session_state.frame_cache_mb, key="frame_cache_mb_input")
+        get_frame_cache().set_budget(st.session_state.frame_cache_mb * 1024 * 1024)
+        st.session_state.proxy_preview = st.checkbox("代理预览（按显示尺寸解码与合成）", value=st.session_state.proxy_preview,
+                                                     key="proxy_preview_check")
+        
+        if st.session_state.video_path and st.session_state.proxy_preview:
+            proxy_width = preview_frame_width()
+            proxy_file = find_proxy(st.session_state.video_path, proxy_width)
+            if proxy_file:
+                st.caption(f"🎞️ 代理文件: {os.path.basename(proxy_file)}")
+            elif st.button("生成代理文件", key="build_proxy"):
+                job_id = get_job_queue().submit_proxy(st.session_state.video_path, proxy_width)
+                st.toast(f"已提交代理生成任务 {job_id}", icon="🎞️")
+        
+        if st.session_state.video_path:
+            thumb_step = thumbnail_step(st.session_state.video_fps)
+            if find_thumbnails(st.session_state.video_path, thumb_step) is not None:
+                st.caption(f"🖼️ 缩略图: 每 {thumb_step} 帧一张")
+            elif st.button("生成缩略图", key="build_thumbs"):
+                job_id = get_job_queue().submit_thumbnails(st.session_state.video_path, thumb_step)
+                st.toast(f"已提交缩略图生成任务 {job_id}", icon="🖼️")
+        
+        st.session_state.client_playback = st.checkbox("浏览器端播放（原生解码，HUD 在浏览器中绘制）", value=st.session_state.client_playback,
+                                                       key="client_playback_check")
+        if st.session_state.video_path and st.session_state.client_playback:
+            playback_file = find_playback_proxy(st.session_state.video_path)
+            if playback_file:
+                st.caption(f"▶️ 播放文件: {os.path.basename(playback_file)}")
+            elif st.button("生成播放文件", key="build_playback"):
+                job_id = get_job_queue().submit_playback(st.session_state.video_path, PLAYBACK_WIDTH)
+                st.toast(f"已提交播放文件生成任务 {job_id}", icon="▶️")
+        
+        if st.session_state.video_path:
+            st.session_state.frame_store_full = st.checkbox("帧存储使用原分辨率（导出也会使用）", value=st.session_state.frame_store_full,
+                                                            key="frame_store_full_check")
+            store_width = None if st.session_state.frame_store_full else preview_frame_width()
+            if get_frame_store(st.session_state.video_path, store_width) is not None:
+                st.caption(f"🧊 帧存储: {os.path.basename(frame_store_path(st.session_state.video_path, store_width))}")
+            else:
+                store_bytes = estimate_frame_store_bytes(st.session_state.total_frames, st.session_state.video_width,
+                                                         st.session_state.video_height, store_width)
+                store_fits = frame_store_fits(store_bytes)
+                if st.button(f"生成帧存储 ({store_bytes / (1024 * 1024):.0f} MB)", key="build_frame_store", disabled=not store_fits):
+                    job_id = get_job_queue().submit_frame_store(st.session_state.video_path, store_width)
+                    st.toast(f"已提交帧存储生成任务 {job_id}", icon="🧊")
+                if not store_fits:
+                    st.caption("⚠️ 解码后体积超出帧存储预算或磁盘剩余空间，适合短片段")
+        
+        cache_stats = get_frame_cache().stats()
+        st.caption(f"📊 缓存: {cache_stats['frames']} 帧 / {cache_stats['bytes'] / (1024 * 1024):.0f} MB | "
+                   f"命中率 {cache_stats['hit_ratio']:.0%} | 句柄: {get_decoder_pool().open_handles()} 个")
         
         if st.button("🗑️ 清除缓存", key="clear_cache"):
-            st.session_state.frame_cache = {}
-            release_cap()
+            get_frame_cache().clear()
+            get_decoder_pool().close()
             st.toast("缓存和句柄已释放", icon="🗑️")
         
         st.divider()
         
         st.header("🚀 视频渲染")
+        export_modes = {
+            'video': "完整视频 (MP4)",
+            'png': "仅 HUD (PNG 序列)",
+            'prores': "仅 HUD (ProRes 4444)",
+            'rgba': "仅 HUD (RGBA 原始流)"
+        }
+        st.session_state.export_mode = st.selectbox("输出模式", list(export_modes), format_func=export_modes.get,
+                                                    index=list(export_modes).index(st.session_state.export_mode),
+                                                    key="export_mode_select")
+        st.session_state.render_workers = st.number_input("渲染进程数（0 = 自动）", min_value=0, max_value=64,
+                                                          value=st.session_state.render_workers, key="render_workers_input")
         if st.button("开始最终渲染", type="primary", key="render_video"):
-            export_rendered_video()
+            submit_render_job()
         
         if st.session_state.video_path:
             video_name = os.path.splitext(os.path.basename(st.session_state.video_path))[0]
@@ -553,6 +886,11 @@ def main():
                 file_size = os.path.getsize(output_path) / (1024 * 1024)
                 st.caption(f"📊 已存在文件: {file_size:.2f} MB")
     
+    with st.expander("📋 渲染任务", expanded=False):
+        if _fragment is None and st.button("🔄 刷新进度", key="refresh_jobs"):
+            st.rerun()
+        render_jobs_panel()
+    
     # 主界面 - 视频播放器 fragment
     st.header("🎬 视频预览 & UI 叠加")
     video_player_fragment()
@@ -577,6 +915,29 @@ def main():
             if st.button(f"P2 攻击 -{p2_damage}", type="primary", use_container_width=True):
                 add_hit_event(2, float(p2_damage), p2_is_super)
         
+        # 自动检测的命中候选：跳转确认后用上面的按钮打点，或直接拒绝
+        candidates = load_hit_candidates(st.session_state.video_path) if st.session_state.video_path else []
+        pending = pending_candidates(candidates)
+        with st.expander(f"🔍 命中候选 ({len(pending)}个待确认)"):
+            if st.button("自动检测命中候选", key="detect_hits", disabled=not st.session_state.video_path):
+                job_id = get_job_queue().submit_detect(st.session_state.video_path)
+                st.toast(f"已提交检测任务 {job_id}", icon="🔍")
+            
+            if not candidates:
+                st.caption("尚未检测，或检测任务仍在进行（见渲染任务面板）")
+            # 按分数从高到低，只列出前 30 个
+            for candidate in pending[:30]:
+                col_candidate, col_jump, col_reject = st.columns([3, 1, 1])
+                with col_candidate:
+                    st.write(f"🎯 t={candidate.timestamp:.2f}s 分数 {candidate.score:.1f}")
+                    st.caption(f"画面 {candidate.motion:.0f} | 闪光 {candidate.flash:.0f} | 音频 {candidate.audio:.0f}")
+                with col_jump:
+                    if st.button("跳转", key=f"candidate_jump_{candidate.frame_idx}"):
+                        jump_to_candidate(candidate)
+                with col_reject:
+                    if st.button("✖", key=f"candidate_reject_{candidate.frame_idx}"):
+                        reject_candidate(candidates, candidate)
+        
         # 事件列表 - 可折叠
         with st.expander(f"📋 事件列表 ({len(st.session_state.engine.hit_events)}个)"):
             if st.session_state.engine.hit_events:
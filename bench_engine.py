@@ -0,0 +1,58 @@
+import random
+import time
+
+from core.engine import FightStateEngine
+
+
+FPS = 60.0
+FRAMES = 6000
+# 事件密度固定为每 2 秒一次，事件越多比赛越长
+EVENT_INTERVAL = 2.0
+# 单次命中伤害（血量百分比），与应用默认的 10 和 bench_events 的取值范围一致
+DAMAGE_RANGE = (1.0, 15.0)
+
+
+def build_engine(event_count: int) -> FightStateEngine:
+    engine = FightStateEngine(fps=FPS)
+    duration = max(FRAMES / FPS, event_count * EVENT_INTERVAL)
+    rng = random.Random(event_count)
+    for _ in range(event_count):
+        engine.add_event(rng.uniform(0.0, duration), rng.choice([1, 2]), rng.uniform(*DAMAGE_RANGE), rng.random() < 0.1)
+    return engine
+
+
+def bench_update(event_count: int) -> tuple:
+    # 从比赛开头计时：按真实伤害，双方血量在几十次命中后见底，之后红槽不再追赶，只剩空闲路径
+    engine = build_engine(event_count)
+    engine.reset()
+    
+    chasing = 0
+    start = time.perf_counter()
+    for _ in range(FRAMES):
+        engine.update(engine.frame_time)
+    elapsed = time.perf_counter() - start
+    
+    # 单独再走一遍统计红槽可见（比主血条长 0.5% 以上）、仍在追赶的帧占比，不计入耗时
+    engine.reset()
+    for _ in range(FRAMES):
+        engine.update(engine.frame_time)
+        chasing += max(engine.p1_hp_display - engine.p1_hp_target, engine.p2_hp_display - engine.p2_hp_target) > 0.5
+    
+    return elapsed / FRAMES * 1e6, chasing / FRAMES
+
+
+def bench_timeline(event_count: int) -> float:
+    # 整场向量化计算，每次命中都开启一个追赶区段
+    engine = build_engine(event_count)
+    n_frames = int(max(FRAMES / FPS, event_count * EVENT_INTERVAL) * FPS)
+    start = time.perf_counter()
+    engine.compute_timeline(n_frames)
+    return (time.perf_counter() - start) * 1000
+
+
+if __name__ == "__main__":
+    print(f"FightStateEngine.update 单帧耗时 ({FRAMES} 帧 @ {FPS:.0f} FPS):")
+    for count in [10, 100, 1000, 10000, 100000]:
+        per_frame_us, chasing = bench_update(count)
+        timeline_ms = bench_timeline(count)
+        print(f"  事件数 {count:>6}: {per_frame_us:8.2f} µs/帧 (追赶中 {chasing:.0%}) | compute_timeline 整场 {timeline_ms:8.1f} ms")
@@ -0,0 +1,133 @@
+import bisect
+import json
+import random
+import time
+import tracemalloc
+from dataclasses import dataclass
+
+from core.events import EventStore
+
+
+# 自动检测等场景下单场比赛可能有上万个事件
+COUNTS = [1000, 10000, 100000]
+QUERIES = 1000
+# 在已有 COUNTS 个事件的表上再逐个插入，测稳态下单次打点的代价
+INSERTS = 200
+
+
+@dataclass
+class ListEvent:
+    timestamp: float
+    player: int
+    damage: float
+    is_super: bool = False
+
+
+class BaselineStore:
+    
+    # 旧实现（EventStore 之前的 FightStateEngine）：HitEvent 列表，每次 add_event 先 append 再按时间戳整体 sort；
+    # 没有区间查询，按时间取事件只能逐个扫描
+    def __init__(self):
+        self.events = []
+    
+    def insert(self, timestamp: float, player: int, damage: float, is_super: bool = False):
+        self.events.append(ListEvent(timestamp, player, damage, is_super))
+        self.events.sort(key=lambda e: e.timestamp)
+    
+    def between(self, start: float, end: float) -> list:
+        return [e for e in self.events if start <= e.timestamp < end]
+    
+    @classmethod
+    def from_dicts(cls, hits: list) -> 'BaselineStore':
+        store = cls()
+        for h in hits:
+            store.events.append(ListEvent(h['timestamp'], h['player'], h.get('damage', 10.0), h.get('is_super', False)))
+        store.events.sort(key=lambda e: e.timestamp)
+        return store
+    
+    def to_dicts(self) -> list:
+        return [
+            {"timestamp": e.timestamp, "player": e.player, "damage": e.damage, "is_super": e.is_super}
+            for e in self.events
+        ]
+
+
+class BisectListStore(BaselineStore):
+    
+    # 对照用的另一种列表布局：平行的时间戳列表 + bisect 定位后 list.insert，区间查询二分；仓库中从未这样实现过
+    def __init__(self):
+        super().__init__()
+        self.times = []
+    
+    def insert(self, timestamp: float, player: int, damage: float, is_super: bool = False):
+        index = bisect.bisect_right(self.times, timestamp)
+        self.events.insert(index, ListEvent(timestamp, player, damage, is_super))
+        self.times.insert(index, timestamp)
+    
+    def between(self, start: float, end: float) -> list:
+        return self.events[bisect.bisect_left(self.times, start):bisect.bisect_left(self.times, end)]
+    
+    @classmethod
+    def from_dicts(cls, hits: list) -> 'BisectListStore':
+        store = super().from_dicts(hits)
+        store.times = [e.timestamp for e in store.events]
+        return store
+
+
+def build_inputs(count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    duration = count * 0.5
+    return [(round(rng.uniform(0.0, duration), 3), rng.choice([1, 2]), rng.uniform(1.0, 15.0), rng.random() < 0.1) for _ in range(count)]
+
+
+def bench(name: str, store_type, count: int):
+    hits = [{"timestamp": t, "player": p, "damage": d, "is_super": s} for t, p, d, s in build_inputs(count, count)]
+    
+    start = time.perf_counter()
+    store = store_type.from_dicts(hits)
+    load_ms = (time.perf_counter() - start) * 1000
+    
+    # 内存单独测一遍，tracemalloc 会拖慢计时
+    tracemalloc.start()
+    measured = store_type.from_dicts(hits)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del measured
+    
+    start = time.perf_counter()
+    for event in build_inputs(INSERTS, 0):
+        store.insert(event[0] * count / INSERTS, *event[1:])
+    insert_us = (time.perf_counter() - start) / INSERTS * 1e6
+    
+    rng = random.Random(0)
+    duration = count * 0.5
+    windows = [rng.uniform(0.0, duration) for _ in range(QUERIES)]
+    start = time.perf_counter()
+    for t in windows:
+        store.between(t, t + 5.0)
+    query_us = (time.perf_counter() - start) / QUERIES * 1e6
+    
+    start = time.perf_counter()
+    json.dumps({"hits": store.to_dicts()})
+    save_ms = (time.perf_counter() - start) * 1000
+    
+    if store_type is EventStore:
+        # 批量插入（自动检测候选等场景）：一次归并
+        timestamps, players, damages, supers = zip(*build_inputs(count, count))
+        start = time.perf_counter()
+        EventStore().extend(timestamps, players, damages, supers)
+        extend_ms = (time.perf_counter() - start) * 1000
+        extra = f" | 批量插入 {extend_ms:6.1f} ms"
+    else:
+        extra = ""
+    
+    print(f"  {name:<10} 插入 {insert_us:8.2f} µs/个 | 内存 {memory / 1024:9.1f} KB | 5 秒区间查询 {query_us:8.2f} µs | "
+          f"保存 {save_ms:7.1f} ms | 加载 {load_ms:7.1f} ms{extra}")
+
+
+if __name__ == "__main__":
+    for count in COUNTS:
+        print(f"事件数 {count}:")
+        bench("旧实现", BaselineStore, count)
+        bench("bisect 列表", BisectListStore, count)
+        bench("EventStore", EventStore, count)
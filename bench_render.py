@@ -0,0 +1,89 @@
+import random
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from core.engine import FightStateEngine
+from core.processor import apply_hud_state, build_hud_states
+from core.renderer import SF6Renderer
+
+
+WIDTH, HEIGHT = 1920, 1080
+FRAMES = 1200
+
+
+def legacy_path(renderer: SF6Renderer, frame: np.ndarray, shake_x: int) -> np.ndarray:
+    # 旧导出循环：BGR -> RGB -> PIL -> RGBA 合成 -> RGB -> ndarray -> BGR
+    image = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    result = renderer.render(image, "Ryu", "Ken", (shake_x, 0)).convert('RGB')
+    return cv2.cvtColor(np.array(result), cv2.COLOR_RGB2BGR)
+
+
+def composite_path(renderer: SF6Renderer, frame: np.ndarray, shake_x: int) -> np.ndarray:
+    return renderer.composite_array(frame, "Ryu", "Ken", (shake_x, 0), channel_order='BGR')
+
+
+def bgr_path(renderer: SF6Renderer, frame: np.ndarray, shake_x: int) -> np.ndarray:
+    return renderer.render_bgr(frame, "Ryu", "Ken", (shake_x, 0))
+
+
+def build_states(seed: int) -> np.ndarray:
+    # 20 秒 60 FPS 的比赛时间轴：约每 1.2 秒一次命中，伤害与 bench_events 相同取 1~15，
+    # 双方合计扣掉大半血量，血条追赶动画与抖动都来自真实引擎
+    engine = FightStateEngine(fps=60.0)
+    rng = random.Random(seed)
+    for i in range(16):
+        engine.add_event(i * 1.2 + rng.uniform(0.0, 0.6), rng.choice([1, 2]), rng.uniform(1.0, 15.0), rng.random() < 0.1)
+    return build_hud_states(engine.compute_timeline(FRAMES, 60.0))
+
+
+def bench(name: str, fn, baseline_ms: float = 0.0) -> float:
+    renderer = SF6Renderer(WIDTH, HEIGHT)
+    frame = np.random.default_rng(0).integers(0, 255, (HEIGHT, WIDTH, 3), dtype=np.uint8)
+    states = build_states(0)
+    
+    def step(state):
+        shake_x, _ = apply_hud_state(renderer, state)
+        fn(renderer, frame, shake_x)
+    
+    # 预热用另一场比赛的时间轴：sprite 缓存与缓冲区达到稳态，但 HUD 记忆里没有计时用的状态
+    for state in build_states(1):
+        step(state)
+    hits, misses = renderer.hud_memo_hits, renderer.hud_memo_misses
+    
+    start = time.perf_counter()
+    for state in states:
+        step(state)
+    per_frame_ms = (time.perf_counter() - start) / FRAMES * 1000
+    # 只统计计时这一遍的 HUD 复用率，与耗时对应
+    lookups = renderer.hud_memo_hits - hits + renderer.hud_memo_misses - misses
+    hit_ratio = (renderer.hud_memo_hits - hits) / lookups if lookups else 0.0
+    
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    peak = 0
+    for state in states:
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        step(state)
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - base)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    
+    stats = after.compare_to(before, 'lineno')
+    blocks = sum(s.count_diff for s in stats) / FRAMES
+    net = sum(s.size_diff for s in stats) / FRAMES
+    speedup = f" | 相对 PIL 往返 {baseline_ms / per_frame_ms:4.1f}x" if baseline_ms else ""
+    print(f"  {name:<16} {per_frame_ms:7.2f} ms/帧 (HUD 复用 {hit_ratio:.0%}{speedup}) | "
+          f"单帧峰值临时内存 {peak / 1024:9.1f} KB | 净增长 {net:7.1f} B/帧, {blocks:5.2f} 块/帧")
+    return per_frame_ms
+
+
+if __name__ == "__main__":
+    print(f"HUD 合成 ({WIDTH}x{HEIGHT}, {FRAMES} 帧):")
+    baseline = bench("PIL 往返", legacy_path)
+    bench("composite_array", composite_path, baseline)
+    bench("render_bgr", bgr_path, baseline)
@@ -0,0 +1,183 @@
+import threading
+import time
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from core.video_index import VideoIndex, seek_capture
+
+
+class DecoderHandle:
+    
+    def __init__(self, video_path: str):
+        self.video_path = video_path
+        self.cap = cv2.VideoCapture(video_path)
+        # 下一次 read() 将返回的帧号
+        self.position = 0
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+        # 已签出（正在读或排队等锁）的调用方数量，只在池锁内修改
+        self.users = 0
+    
+    def is_opened(self) -> bool:
+        return self.cap is not None and self.cap.isOpened()
+    
+    def read_at(self, frame_idx: int, grab_limit: int, index: Optional[VideoIndex] = None) -> Optional[np.ndarray]:
+        keyframe = index.keyframe_before(frame_idx) if index is not None else None
+        gap = frame_idx - self.position
+        # 同一 GOP 内向前跳转时顺序解码与 seek 的代价相同，直接 grab 更可控
+        sequential = 0 <= gap <= grab_limit or (keyframe is not None and keyframe <= self.position <= frame_idx)
+        
+        if not sequential:
+            # 与导出分段相同的定位与回退规则
+            self.position, frame = seek_capture(self.cap, frame_idx, index)
+            if frame is not None:
+                return self._finish(True, frame, frame_idx)
+        
+        # 顺序读取：不 seek，前跳只 grab 不做颜色转换
+        for _ in range(frame_idx - self.position):
+            if not self.cap.grab():
+                self.position = -1
+                return None
+        
+        ret, frame = self.cap.read()
+        return self._finish(ret, frame, frame_idx)
+    
+    def _finish(self, ret: bool, frame: Optional[np.ndarray], frame_idx: int) -> Optional[np.ndarray]:
+        self.last_used = time.monotonic()
+        if not ret:
+            self.position = -1
+            return None
+        self.position = frame_idx + 1
+        return frame
+    
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+
+class DecoderPool:
+    
+    def __init__(self, handles_per_video: int = 2, idle_timeout: float = 60.0, grab_limit: int = 30):
+        self.handles_per_video = max(1, handles_per_video)
+        self.idle_timeout = idle_timeout
+        self.grab_limit = grab_limit
+        
+        self._lock = threading.Lock()
+        self._handles: Dict[str, List[DecoderHandle]] = {}
+        self._indexes: Dict[str, VideoIndex] = {}
+        self.stats = {'sequential': 0, 'seek': 0, 'open': 0, 'closed': 0}
+        
+        self._stop = threading.Event()
+        self._reaper = threading.Thread(target=self._reap_loop, name="decoder-reaper", daemon=True)
+        self._reaper.start()
+    
+    def set_index(self, video_path: str, index: Optional[VideoIndex]):
+        with self._lock:
+            if index is None:
+                self._indexes.pop(video_path, None)
+            else:
+                self._indexes[video_path] = index
+    
+    def _checkout(self, video_path: str, frame_idx: int) -> DecoderHandle:
+        with self._lock:
+            handles = self._handles.setdefault(video_path, [])
+            idle = [h for h in handles if not h.users]
+            index = self._indexes.get(video_path)
+            keyframe = index.keyframe_before(frame_idx) if index is not None else None
+            
+            # 优先选择刚好停在目标帧之前（或同一 GOP 内）的句柄，其次是最久未用的空闲句柄
+            forward = [
+                h for h in idle
+                if 0 <= frame_idx - h.position <= self.grab_limit
+                or (keyframe is not None and keyframe <= h.position <= frame_idx)
+            ]
+            if forward:
+                handle = min(forward, key=lambda h: frame_idx - h.position)
+                self.stats['sequential'] += 1
+            elif idle and len(handles) >= self.handles_per_video:
+                handle = min(idle, key=lambda h: h.last_used)
+                self.stats['seek'] += 1
+            elif len(handles) < self.handles_per_video:
+                cv2.setNumThreads(0)
+                handle = DecoderHandle(video_path)
+                handles.append(handle)
+                self.stats['open'] += 1
+            else:
+                # 所有句柄都在使用中，排队等待最早空闲的那个
+                handle = min(handles, key=lambda h: h.last_used)
+                self.stats['seek'] += 1
+            
+            handle.last_used = time.monotonic()
+            # 在池锁内标记占用，避免拿到句柄锁之前被空闲回收关闭
+            handle.users += 1
+        
+        handle.lock.acquire()
+        return handle
+    
+    def read(self, video_path: str, frame_idx: int) -> Optional[np.ndarray]:
+        handle = self._checkout(video_path, frame_idx)
+        try:
+            if not handle.is_opened():
+                frame = None
+            else:
+                frame = handle.read_at(frame_idx, self.grab_limit, self._indexes.get(video_path))
+        finally:
+            handle.lock.release()
+            with self._lock:
+                handle.users -= 1
+        
+        if frame is None:
+            # 读取失败的句柄可能已损坏，直接丢弃，下次重新打开
+            self._discard(handle)
+        return frame
+    
+    def _discard(self, handle: DecoderHandle):
+        with self._lock:
+            handles = self._handles.get(handle.video_path, [])
+            if handle in handles:
+                handles.remove(handle)
+                if not handles:
+                    del self._handles[handle.video_path]
+        with handle.lock:
+            handle.release()
+        self.stats['closed'] += 1
+    
+    def close(self, video_path: Optional[str] = None):
+        with self._lock:
+            if video_path is None:
+                handles = [h for group in self._handles.values() for h in group]
+                self._handles.clear()
+            else:
+                handles = self._handles.pop(video_path, [])
+        for handle in handles:
+            with handle.lock:
+                handle.release()
+            self.stats['closed'] += 1
+    
+    def close_idle(self, max_idle: Optional[float] = None):
+        max_idle = self.idle_timeout if max_idle is None else max_idle
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                h for group in self._handles.values() for h in group
+                if not h.users and now - h.last_used > max_idle
+            ]
+        for handle in expired:
+            self._discard(handle)
+    
+    def open_handles(self, video_path: Optional[str] = None) -> int:
+        with self._lock:
+            if video_path is not None:
+                return len(self._handles.get(video_path, []))
+            return sum(len(group) for group in self._handles.values())
+    
+    def _reap_loop(self):
+        while not self._stop.wait(max(1.0, self.idle_timeout / 4)):
+            self.close_idle()
+    
+    def shutdown(self):
+        self._stop.set()
+        self.close()
@@ -0,0 +1,244 @@
+import json
+import os
+import subprocess
+from dataclasses import asdict, dataclass
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from core.ffmpeg_utils import find_ffmpeg
+from core.processor import probe_video
+
+
+# 分析用的降采样宽度与一次处理的帧数
+ANALYSIS_WIDTH = 160
+CHUNK_FRAMES = 256
+AUDIO_RATE = 8000
+AUDIO_SLACK_FRAMES = 2
+
+SIGNAL_WEIGHTS = {'motion': 1.0, 'flash': 1.0, 'audio': 1.0}
+
+
+@dataclass
+class HitCandidate:
+    frame_idx: int
+    timestamp: float
+    score: float
+    # 各信号的稳健 z 分数（只保留正向部分）
+    motion: float = 0.0
+    flash: float = 0.0
+    audio: float = 0.0
+    rejected: bool = False
+
+
+def candidates_path(video_path: str, data_dir: str = "data") -> str:
+    video_name = os.path.splitext(os.path.basename(video_path))[0]
+    return os.path.join(data_dir, f"{video_name}.candidates.json")
+
+
+def _analysis_size(width: int, height: int, analysis_width: int) -> Tuple[int, int]:
+    w = min(width, analysis_width)
+    h = max(2, round(height * w / width / 2) * 2)
+    return w - w % 2, h
+
+
+def _gray_chunks_ffmpeg(video_path: str, ffmpeg: str, size: Tuple[int, int]) -> Iterator[np.ndarray]:
+    # ffmpeg 解码时直接缩放成小尺寸灰度图，管道里只传很少的数据；passthrough 保证不补帧、不丢帧
+    w, h = size
+    process = subprocess.Popen(
+        [ffmpeg, '-v', 'error', '-i', video_path, '-map', '0:v:0', '-vf', f"scale={w}:{h}:flags=area,format=gray",
+         '-fps_mode', 'passthrough', '-f', 'rawvideo', '-'],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    frame_bytes = w * h
+    try:
+        while True:
+            data = process.stdout.read(frame_bytes * CHUNK_FRAMES)
+            count = len(data) // frame_bytes
+            if count == 0:
+                break
+            yield np.frombuffer(data, dtype=np.uint8, count=count * frame_bytes).reshape(count, h, w)
+    finally:
+        process.stdout.close()
+        process.kill()
+        process.wait()
+
+
+def _gray_chunks_cv2(video_path: str, size: Tuple[int, int]) -> Iterator[np.ndarray]:
+    w, h = size
+    cap = cv2.VideoCapture(video_path)
+    chunk = np.empty((CHUNK_FRAMES, h, w), dtype=np.uint8)
+    count = 0
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), size, dst=chunk[count], interpolation=cv2.INTER_AREA)
+            count += 1
+            if count == CHUNK_FRAMES:
+                yield chunk.copy()
+                count = 0
+        if count:
+            yield chunk[:count].copy()
+    finally:
+        cap.release()
+
+
+def _frame_signals(chunks: Iterator[np.ndarray], total_frames: int,
+                   progress_callback: Optional[Callable[[float], None]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    # 每帧两个标量：去掉整体亮度后的帧差（画面突变、震屏）与平均亮度（闪白）
+    motion, brightness = [], []
+    previous = None
+    done = 0
+    try:
+        for chunk in chunks:
+            frames = chunk.astype(np.float32)
+            means = frames.mean(axis=(1, 2))
+            frames -= means[:, None, None]
+            
+            if previous is None:
+                diffs = np.abs(np.diff(frames, axis=0)).mean(axis=(1, 2))
+                diffs = np.concatenate(([0.0], diffs))
+            else:
+                diffs = np.abs(np.diff(np.concatenate((previous[None], frames)), axis=0)).mean(axis=(1, 2))
+            previous = frames[-1]
+            
+            motion.append(diffs)
+            brightness.append(means)
+            done += len(chunk)
+            if progress_callback and total_frames > 0:
+                progress_callback(min(0.95, done / total_frames))
+    finally:
+        chunks.close()
+    
+    if not motion:
+        return np.zeros(0), np.zeros(0)
+    return np.concatenate(motion).astype(np.float64), np.concatenate(brightness).astype(np.float64)
+
+
+def _frame_energy(samples: np.ndarray, fps: float, n_frames: int) -> np.ndarray:
+    # 每帧时间窗内的平均能量；按累积和做差，最后一帧之后的音频（音轨比视频长）不会计入任何一帧
+    bounds = np.minimum(len(samples), np.floor(np.arange(n_frames + 1) * AUDIO_RATE / fps).astype(np.int64))
+    cumulative = np.concatenate(([0.0], np.cumsum(samples ** 2)))
+    lengths = bounds[1:] - bounds[:-1]
+    energy = np.zeros(n_frames)
+    valid = lengths > 0
+    energy[valid] = (cumulative[bounds[1:]] - cumulative[bounds[:-1]])[valid] / lengths[valid]
+    return energy
+
+
+def _audio_onsets(video_path: str, ffmpeg: Optional[str], fps: float, n_frames: int) -> Optional[np.ndarray]:
+    # 单声道 8 kHz 足够捕捉打击音的能量突变；没有音轨时返回 None
+    if not ffmpeg or n_frames == 0:
+        return None
+    result = subprocess.run(
+        [ffmpeg, '-v', 'error', '-i', video_path, '-map', '0:a:0', '-vn', '-ac', '1', '-ar', str(AUDIO_RATE), '-f', 's16le', '-'],
+        capture_output=True
+    )
+    if result.returncode != 0 or not result.stdout:
+        return None
+    
+    samples = np.frombuffer(result.stdout, dtype='<i2').astype(np.float64) / 32768.0
+    energy = _frame_energy(samples, fps, n_frames)
+    
+    # 对数能量的正向跳变即为起音
+    log_energy = np.log10(energy + 1e-8)
+    return np.maximum(0.0, np.diff(log_energy, prepend=log_energy[:1]))
+
+
+def _rolling_median(values: np.ndarray, window: int) -> np.ndarray:
+    half = window // 2
+    padded = np.pad(values, (half, window - half - 1), mode='edge')
+    return np.median(np.lib.stride_tricks.sliding_window_view(padded, window), axis=1)
+
+
+def _max_filter(values: np.ndarray, radius: int) -> np.ndarray:
+    padded = np.pad(values, radius, mode='edge')
+    return np.lib.stride_tricks.sliding_window_view(padded, 2 * radius + 1).max(axis=1)
+
+
+def _robust_z(values: np.ndarray, window: int) -> np.ndarray:
+    # 相对局部中位数的偏离，再按全局 MAD 归一化；只保留高于基线的部分
+    if len(values) == 0:
+        return values
+    residual = values - _rolling_median(values, window)
+    scale = 1.4826 * np.median(np.abs(residual - np.median(residual)))
+    if scale < 1e-6:
+        scale = max(1e-6, float(np.std(residual)))
+    return np.maximum(0.0, residual / scale)
+
+
+def _pick_peaks(score: np.ndarray, min_gap: int, min_score: float, top_k: int) -> List[int]:
+    # 从高分到低分贪心选取，已选峰值附近 min_gap 帧内的其他帧被抑制
+    above = np.flatnonzero(score >= min_score)
+    order = above[np.argsort(-score[above], kind='stable')]
+    suppressed = np.zeros(len(score), dtype=bool)
+    peaks = []
+    for idx in order:
+        if suppressed[idx]:
+            continue
+        peaks.append(int(idx))
+        if len(peaks) >= top_k:
+            break
+        suppressed[max(0, idx - min_gap):idx + min_gap + 1] = True
+    return peaks
+
+
+def detect_hits(video_path: str, analysis_width: int = ANALYSIS_WIDTH, min_gap: float = 0.1, min_score: float = 8.0,
+                top_k: int = 500, progress_callback: Optional[Callable[[float], None]] = None) -> List[HitCandidate]:
+    # 只顺序解码一遍，按分数从高到低返回候选帧
+    total_frames, fps, width, height = probe_video(video_path)
+    ffmpeg = find_ffmpeg()
+    size = _analysis_size(width, height, analysis_width)
+    
+    chunks = _gray_chunks_ffmpeg(video_path, ffmpeg, size) if ffmpeg else _gray_chunks_cv2(video_path, size)
+    motion, brightness = _frame_signals(chunks, total_frames, progress_callback)
+    n_frames = len(motion)
+    if n_frames == 0:
+        return []
+    
+    window = max(3, int(round(fps)))
+    signals = {
+        'motion': _robust_z(motion, window),
+        # 闪白只看亮度相对前几帧的上升
+        'flash': _robust_z(np.maximum(0.0, np.diff(brightness, prepend=brightness[:1])), window),
+    }
+    audio = _audio_onsets(video_path, ffmpeg, fps, n_frames)
+    if audio is not None:
+        # 音频编码有几十毫秒的起始延迟，起音峰值向前后各扩展几帧再与画面信号对齐
+        signals['audio'] = _max_filter(_robust_z(audio, window), AUDIO_SLACK_FRAMES)
+    
+    # z 分数取对数压缩后相加：几个信号同时出现比单个信号极端突出更像命中
+    score = sum(SIGNAL_WEIGHTS[name] * np.log1p(values) for name, values in signals.items())
+    peaks = _pick_peaks(score, max(1, int(round(min_gap * fps))), min_score, top_k)
+    
+    if progress_callback:
+        progress_callback(1.0)
+    return [
+        HitCandidate(
+            frame_idx=idx,
+            timestamp=idx / fps,
+            score=float(score[idx]),
+            **{name: float(values[idx]) for name, values in signals.items()}
+        )
+        for idx in peaks
+    ]
+
+
+def save_candidates(path: str, candidates: List[HitCandidate]):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({'candidates': [asdict(c) for c in candidates]}, f)
+    os.replace(temp_path, path)
+
+
+def load_candidates(path: str) -> List[HitCandidate]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return [HitCandidate(**item) for item in data.get('candidates', [])]
+    except (OSError, ValueError, TypeError):
+        return []
@@ -1,15 +1,33 @@
-import json
 import random
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, Iterable, List, Tuple, Optional
 from dataclasses import dataclass
 
+import numpy as np
+
+from core.events import EventStore, HitEvent
+from core.match_store import MatchStore
+
 
 @dataclass
-class HitEvent:
-    timestamp: float
-    player: int
-    damage: float
-    is_super: bool = False
+class FightTimeline:
+    time: np.ndarray
+    p1_hp_target: np.ndarray
+    p1_hp_display: np.ndarray
+    p1_drive: np.ndarray
+    p2_hp_target: np.ndarray
+    p2_hp_display: np.ndarray
+    p2_drive: np.ndarray
+    shake: np.ndarray
+    
+    def __len__(self) -> int:
+        return len(self.time)
+    
+    def shake_offsets(self, seed: int = 0) -> np.ndarray:
+        # 每帧的抖动随机数只由 seed 决定，任意切分时间轴（多进程、分段缓存）都得到相同结果
+        rng = np.random.default_rng(seed)
+        offsets = (rng.uniform(-1, 1, (len(self.time), 2)) * self.shake[:, None]).astype(np.int64)
+        offsets[self.shake < 0.1] = 0
+        return offsets
 
 
 class FightStateEngine:
@@ -20,8 +38,10 @@ class FightStateEngine:
         
         self.current_time = 0.0
         self.prev_time = 0.0
-        self.hit_events: List[HitEvent] = []
-        self.processed_event_indices = set()
+        self.events = EventStore()
+        self.event_cursor = 0
+        # 事件表每次增删或整体替换后递增，调用方据此判断按事件生成的缓存是否过期
+        self.events_version = 0
         
         self.p1_hp_target = 100.0
         self.p1_hp_display = 100.0
@@ -42,22 +62,54 @@ class FightStateEngine:
         self.p1_last_hit_time = 0.0
         self.p2_last_hit_time = 0.0
         self.hit_player = None
+        
+        # seek_to 使用的状态检查点：第 k 个检查点是逐帧推进 k * interval 帧后的完整状态
+        self.checkpoint_interval = 1.0
+        self._checkpoints: List[tuple] = []
+    
+    @property
+    def hit_events(self) -> EventStore:
+        return self.events
     
     def load_events_from_json(self, json_path: str):
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            for event in data.get('hits', []):
-                self.hit_events.append(HitEvent(
-                    timestamp=event['timestamp'],
-                    player=event['player'],
-                    damage=event.get('damage', 10.0),
-                    is_super=event.get('is_super', False)
-                ))
-        self.hit_events.sort(key=lambda e: e.timestamp)
+        # 快照之后追加的日志也要回放，与应用和批量渲染读到的事件一致
+        self.set_events(MatchStore(json_path).load())
+    
+    def set_events(self, events: Iterable[HitEvent]):
+        self.events = EventStore.from_events(events)
+        self.event_cursor = int(np.searchsorted(self.events.timestamps, self.prev_time, side='right'))
+        self.events_version += 1
+        self.invalidate_checkpoints()
     
     def add_event(self, timestamp: float, player: int, damage: float, is_super: bool = False):
-        self.hit_events.append(HitEvent(timestamp, player, damage, is_super))
-        self.hit_events.sort(key=lambda e: e.timestamp)
+        index = self.events.insert(timestamp, player, damage, is_super)
+        # 插入到游标之前的事件视为已经过去，与逐帧扫描时不会补触发的行为一致
+        if index < self.event_cursor:
+            self.event_cursor += 1
+        self.events_version += 1
+        self.invalidate_checkpoints(timestamp)
+        return index
+    
+    def remove_event(self, index: int) -> HitEvent:
+        if index < 0:
+            index += len(self.events)
+        event = self.events.remove(index)
+        if index < self.event_cursor:
+            self.event_cursor -= 1
+        self.events_version += 1
+        self.invalidate_checkpoints(event.timestamp)
+        return event
+    
+    def invalidate_checkpoints(self, from_time: Optional[float] = None):
+        if from_time is None:
+            self._checkpoints.clear()
+            return
+        
+        # 只有早于该时间戳（含触发容差）的检查点不受影响
+        keep = 0
+        while keep < len(self._checkpoints) and self._checkpoints[keep][0] + 1e-6 < from_time:
+            keep += 1
+        del self._checkpoints[keep:]
     
     def _apply_hit(self, event: HitEvent):
         target_player = 2 if event.player == 1 else 1
@@ -86,10 +138,20 @@ class FightStateEngine:
         self.prev_time = self.current_time
         self.current_time += delta_time
         
-        for i, event in enumerate(self.hit_events):
-            if i not in self.processed_event_indices and self.prev_time < event.timestamp <= self.current_time + 1e-6:
-                self._apply_hit(event)
-                self.processed_event_indices.add(i)
+        times = self.events.timestamps
+        cursor = self.event_cursor
+        count = len(times)
+        
+        # 时间戳不晚于上一帧的事件永远不会触发，直接跳过
+        while cursor < count and times[cursor] <= self.prev_time:
+            cursor += 1
+        
+        limit = self.current_time + 1e-6
+        while cursor < count and times[cursor] <= limit:
+            self._apply_hit(self.events[cursor])
+            cursor += 1
+        
+        self.event_cursor = cursor
         
         self.p1_hp_display = self._smooth_chase(self.p1_hp_display, self.p1_hp_target, self.p1_last_hit_time)
         self.p2_hp_display = self._smooth_chase(self.p2_hp_display, self.p2_hp_target, self.p2_last_hit_time)
@@ -102,12 +164,15 @@ class FightStateEngine:
         self.p1_drive = min(6.0, self.p1_drive + drive_regen)
         self.p2_drive = min(6.0, self.p2_drive + drive_regen)
     
-    def get_shake_offset(self) -> Tuple[int, int]:
-        if self.current_shake < 0.1:
+    def get_shake_offset(self, magnitude: Optional[float] = None) -> Tuple[int, int]:
+        if magnitude is None:
+            magnitude = self.current_shake
+        
+        if magnitude < 0.1:
             return (0, 0)
         
-        offset_x = random.uniform(-1, 1) * self.current_shake
-        offset_y = random.uniform(-1, 1) * self.current_shake
+        offset_x = random.uniform(-1, 1) * magnitude
+        offset_y = random.uniform(-1, 1) * magnitude
         
         return (int(offset_x), int(offset_y))
     
@@ -130,7 +195,7 @@ class FightStateEngine:
     def reset(self):
         self.current_time = 0.0
         self.prev_time = 0.0
-        self.processed_event_indices.clear()
+        self.event_cursor = 0
         self.p1_hp_target = 100.0
         self.p1_hp_display = 100.0
         self.p2_hp_target = 100.0
@@ -142,15 +207,149 @@ class FightStateEngine:
         self.p2_last_hit_time = 0.0
         self.hit_player = None
     
+    def _snapshot(self) -> tuple:
+        return (
+            self.current_time, self.prev_time, self.event_cursor,
+            self.p1_hp_target, self.p1_hp_display, self.p2_hp_target, self.p2_hp_display,
+            self.p1_drive, self.p2_drive, self.current_shake,
+            self.p1_last_hit_time, self.p2_last_hit_time, self.hit_player
+        )
+    
+    def _restore(self, snapshot: tuple):
+        (
+            self.current_time, self.prev_time, self.event_cursor,
+            self.p1_hp_target, self.p1_hp_display, self.p2_hp_target, self.p2_hp_display,
+            self.p1_drive, self.p2_drive, self.current_shake,
+            self.p1_last_hit_time, self.p2_last_hit_time, self.hit_player
+        ) = snapshot
+    
     def seek_to(self, time: float):
-        self.reset()
-        self.current_time = time
+        # 结果与从 0 开始逐帧 update 到 round(time * fps) 帧完全一致，
+        # 包括红槽追赶、驱动槽恢复和抖动衰减；最多只需重放一个检查点间隔
+        target_frame = max(0, int(round(time * self.fps)))
+        interval = max(1, int(round(self.checkpoint_interval * self.fps)))
+        slot = target_frame // interval
         
-        for i, event in enumerate(self.hit_events):
-            if event.timestamp <= time:
-                self._apply_hit(event)
-                self.processed_event_indices.add(i)
+        if not self._checkpoints:
+            self.reset()
+            self._checkpoints.append(self._snapshot())
         
-        self.p1_hp_display = self.p1_hp_target
-        self.p2_hp_display = self.p2_hp_target
-        self.current_shake = 0.0
+        while len(self._checkpoints) <= slot:
+            self._restore(self._checkpoints[-1])
+            for _ in range(interval):
+                self.update(self.frame_time)
+            self._checkpoints.append(self._snapshot())
+        
+        self._restore(self._checkpoints[slot])
+        for _ in range(target_frame - slot * interval):
+            self.update(self.frame_time)
+    
+    def _shake_sequence(self, start: float, limit: int) -> List[float]:
+        sequence = []
+        shake = start
+        while len(sequence) < limit:
+            shake *= self.shake_decay
+            if shake < 0.1:
+                break
+            sequence.append(shake)
+        return sequence
+    
+    def _player_hp_timeline(self, times: np.ndarray, hit_frames: np.ndarray, damage: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        n_frames = len(times)
+        if len(hit_frames) == 0:
+            full = np.full(n_frames, 100.0)
+            return full, full.copy()
+        
+        # 逐次扣血再截断到 0，与 _apply_hit 的浮点运算顺序一致
+        hp_after = np.maximum(0.0, np.subtract.accumulate(np.concatenate(([100.0], damage))))[1:]
+        
+        # 同一帧内的多次受击只保留最后的状态，每个受击帧开启一个目标血量恒定的区段
+        last_in_frame = np.append(hit_frames[1:] != hit_frames[:-1], True)
+        seg_start = hit_frames[last_in_frame]
+        seg_target = hp_after[last_in_frame]
+        seg_chase = np.maximum(seg_start, np.searchsorted(times, times[seg_start] + self.hit_delay, side='left'))
+        
+        keep = 1.0 - self.hp_decay
+        seg_display = np.empty(len(seg_start))
+        display = 100.0
+        for j in range(len(seg_start)):
+            seg_display[j] = display
+            if j + 1 < len(seg_start):
+                target = seg_target[j]
+                if display <= target:
+                    display = target
+                else:
+                    steps = max(0, int(seg_start[j + 1]) - int(seg_chase[j]))
+                    display = target + (display - target) * keep ** steps
+        
+        frames = np.arange(n_frames)
+        seg = np.searchsorted(seg_start, frames, side='right') - 1
+        before = seg < 0
+        seg = np.maximum(seg, 0)
+        
+        target = seg_target[seg]
+        start_display = seg_display[seg]
+        steps = np.maximum(0, frames - seg_chase[seg] + 1)
+        display = np.where(start_display <= target, target, target + (start_display - target) * keep ** steps)
+        
+        target[before] = 100.0
+        display[before] = 100.0
+        return target, display
+    
+    def compute_timeline(self, n_frames: int, fps: Optional[float] = None) -> FightTimeline:
+        # 第 i 帧的显示时间为 i / fps，对应从 reset 状态起 update(1 / fps) 调用 i 次之后的状态（与 seek_to(i / fps) 相同）；
+        # 预览、浏览器端播放和导出都按这一行在第 i 帧上叠加 HUD
+        fps = fps or self.fps
+        n_frames = max(0, int(n_frames))
+        delta_time = 1.0 / fps
+        # 逐次累加，与 update 中 current_time 的浮点误差一致
+        times = np.concatenate(([0.0], np.cumsum(np.full(max(0, n_frames - 1), delta_time))))[:n_frames]
+        
+        timestamps = self.events.timestamps
+        players = self.events.players
+        damages = self.events.damages
+        supers = self.events.supers
+        
+        # 事件最早在第 1 次 update 时触发，第 0 帧总是初始状态
+        hit_frames = np.maximum(1, np.searchsorted(times + 1e-6, timestamps, side='left'))
+        fired = (timestamps > 0.0) & (hit_frames < n_frames)
+        hit_frames = hit_frames[fired]
+        targets = np.where(players[fired] == 1, 2, 1)
+        damages = damages[fired]
+        supers = supers[fired]
+        
+        p1_target, p1_display = self._player_hp_timeline(times, hit_frames[targets == 1], damages[targets == 1])
+        p2_target, p2_display = self._player_hp_timeline(times, hit_frames[targets == 2], damages[targets == 2])
+        
+        shake = np.zeros(n_frames)
+        if len(hit_frames):
+            normal = self._shake_sequence(self.shake_intensity, n_frames)
+            boosted = self._shake_sequence(self.shake_intensity * 2.0, n_frames)
+            width = max(len(normal), len(boosted)) + 1
+            table = np.zeros((2, width))
+            table[0, :len(normal)] = normal
+            table[1, :len(boosted)] = boosted
+            
+            last_in_frame = np.append(hit_frames[1:] != hit_frames[:-1], True)
+            shake_frames = hit_frames[last_in_frame]
+            shake_kind = supers[last_in_frame].astype(np.int64)
+            
+            frames = np.arange(n_frames)
+            seg = np.searchsorted(shake_frames, frames, side='right') - 1
+            active = seg >= 0
+            seg = np.maximum(seg, 0)
+            age = np.clip(frames - shake_frames[seg], 0, width - 1)
+            shake = np.where(active, table[shake_kind[seg], age], 0.0)
+        
+        drive = np.minimum(6.0, 6 + self.drive_regen_rate * delta_time * np.arange(n_frames))
+        
+        return FightTimeline(
+            time=times,
+            p1_hp_target=p1_target,
+            p1_hp_display=p1_display,
+            p1_drive=drive,
+            p2_hp_target=p2_target,
+            p2_hp_display=p2_display,
+            p2_drive=drive.copy(),
+            shake=shake
+        )
@@ -0,0 +1,207 @@
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+
+# flags 列的位定义
+FLAG_SUPER = 1
+
+
+class HitEvent:
+    __slots__ = ('timestamp', 'player', 'damage', 'is_super')
+    
+    def __init__(self, timestamp: float, player: int, damage: float, is_super: bool = False):
+        self.timestamp = timestamp
+        self.player = player
+        self.damage = damage
+        self.is_super = is_super
+    
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, HitEvent):
+            return NotImplemented
+        return (self.timestamp, self.player, self.damage, self.is_super) == (other.timestamp, other.player, other.damage, other.is_super)
+    
+    def __repr__(self) -> str:
+        return f"HitEvent(timestamp={self.timestamp!r}, player={self.player!r}, damage={self.damage!r}, is_super={self.is_super!r})"
+
+
+class EventStore:
+    
+    # 按时间戳有序的列式事件表：时间戳、攻击方、伤害、标志位各一个连续数组，容量按倍数增长
+    # 下标访问和迭代返回 HitEvent 记录的副本，修改记录不会写回
+    def __init__(self, capacity: int = 16):
+        capacity = max(1, capacity)
+        self._timestamps = np.empty(capacity, dtype=np.float64)
+        self._players = np.empty(capacity, dtype=np.int8)
+        self._damages = np.empty(capacity, dtype=np.float64)
+        self._flags = np.empty(capacity, dtype=np.uint8)
+        self._size = 0
+    
+    @classmethod
+    def from_columns(cls, timestamps, players, damages, supers) -> 'EventStore':
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        # 稳定排序：时间戳相同的事件保持输入顺序
+        order = np.argsort(timestamps, kind='stable')
+        store = cls(len(timestamps))
+        size = len(timestamps)
+        store._timestamps[:size] = timestamps[order]
+        store._players[:size] = np.asarray(players, dtype=np.int8)[order]
+        store._damages[:size] = np.asarray(damages, dtype=np.float64)[order]
+        store._flags[:size] = np.where(np.asarray(supers, dtype=bool)[order], FLAG_SUPER, 0)
+        store._size = size
+        return store
+    
+    @classmethod
+    def from_events(cls, events: Iterable[HitEvent]) -> 'EventStore':
+        if isinstance(events, EventStore):
+            return events.copy()
+        events = list(events)
+        return cls.from_columns(
+            [e.timestamp for e in events],
+            [e.player for e in events],
+            [e.damage for e in events],
+            [e.is_super for e in events]
+        )
+    
+    @classmethod
+    def from_dicts(cls, hits: List[dict]) -> 'EventStore':
+        # 对应比赛 JSON 的 hits 列表，缺省值与旧的逐条解析一致
+        count = len(hits)
+        return cls.from_columns(
+            np.fromiter((h['timestamp'] for h in hits), dtype=np.float64, count=count),
+            np.fromiter((h['player'] for h in hits), dtype=np.int8, count=count),
+            np.fromiter((h.get('damage', 10.0) for h in hits), dtype=np.float64, count=count),
+            np.fromiter((h.get('is_super', False) for h in hits), dtype=bool, count=count)
+        )
+    
+    def to_dicts(self) -> List[dict]:
+        # 整列 tolist 一次性转成 Python 标量，再按行组装
+        return [
+            {"timestamp": t, "player": p, "damage": d, "is_super": s}
+            for t, p, d, s in zip(self.timestamps.tolist(), self.players.tolist(), self.damages.tolist(), self.supers.tolist())
+        ]
+    
+    def copy(self) -> 'EventStore':
+        store = EventStore(self._size)
+        store._timestamps[:self._size] = self.timestamps
+        store._players[:self._size] = self.players
+        store._damages[:self._size] = self.damages
+        store._flags[:self._size] = self._flags[:self._size]
+        store._size = self._size
+        return store
+    
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self._timestamps[:self._size]
+    
+    @property
+    def players(self) -> np.ndarray:
+        return self._players[:self._size]
+    
+    @property
+    def damages(self) -> np.ndarray:
+        return self._damages[:self._size]
+    
+    @property
+    def supers(self) -> np.ndarray:
+        return (self._flags[:self._size] & FLAG_SUPER) != 0
+    
+    @property
+    def nbytes(self) -> int:
+        return self._timestamps.nbytes + self._players.nbytes + self._damages.nbytes + self._flags.nbytes
+    
+    def __len__(self) -> int:
+        return self._size
+    
+    def __getitem__(self, index: int) -> HitEvent:
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("event index out of range")
+        return HitEvent(
+            float(self._timestamps[index]),
+            int(self._players[index]),
+            float(self._damages[index]),
+            bool(self._flags[index] & FLAG_SUPER)
+        )
+    
+    def _records(self, lo: int, hi: int) -> List[HitEvent]:
+        # 按列切片后整体 tolist，比逐个取 numpy 标量快一个数量级
+        return [
+            HitEvent(t, p, d, bool(f & FLAG_SUPER))
+            for t, p, d, f in zip(self._timestamps[lo:hi].tolist(), self._players[lo:hi].tolist(),
+                                  self._damages[lo:hi].tolist(), self._flags[lo:hi].tolist())
+        ]
+    
+    def __iter__(self) -> Iterator[HitEvent]:
+        return iter(self._records(0, self._size))
+    
+    def __reversed__(self) -> Iterator[HitEvent]:
+        return reversed(self._records(0, self._size))
+    
+    def _grow(self, needed: int):
+        if needed <= len(self._timestamps):
+            return
+        capacity = max(needed, 2 * len(self._timestamps))
+        for name in ('_timestamps', '_players', '_damages', '_flags'):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+    
+    def insert(self, timestamp: float, player: int, damage: float, is_super: bool = False) -> int:
+        # 二分定位到同一时间戳的最后一个事件之后，后续元素整体后移一格（memmove）
+        index = int(np.searchsorted(self.timestamps, timestamp, side='right'))
+        self._grow(self._size + 1)
+        size = self._size
+        for column in (self._timestamps, self._players, self._damages, self._flags):
+            column[index + 1:size + 1] = column[index:size]
+        self._timestamps[index] = timestamp
+        self._players[index] = player
+        self._damages[index] = damage
+        self._flags[index] = FLAG_SUPER if is_super else 0
+        self._size = size + 1
+        return index
+    
+    def extend(self, timestamps, players, damages, supers) -> np.ndarray:
+        # 批量插入（如自动检测出的候选），一次归并代替逐条插入；返回新事件在合并后的位置
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        count = len(timestamps)
+        size = self._size
+        self._grow(size + count)
+        self._timestamps[size:size + count] = timestamps
+        self._players[size:size + count] = np.asarray(players, dtype=np.int8)
+        self._damages[size:size + count] = np.asarray(damages, dtype=np.float64)
+        self._flags[size:size + count] = np.where(np.asarray(supers, dtype=bool), FLAG_SUPER, 0)
+        self._size = size + count
+        
+        # 稳定排序保证新事件排在同一时间戳的已有事件之后，与 insert 一致
+        order = np.argsort(self.timestamps, kind='stable')
+        for column in (self._timestamps, self._players, self._damages, self._flags):
+            column[:self._size] = column[:self._size][order]
+        
+        positions = np.empty(self._size, dtype=np.int64)
+        positions[order] = np.arange(self._size)
+        return positions[size:]
+    
+    def remove(self, index: int) -> HitEvent:
+        event = self[index]
+        if index < 0:
+            index += self._size
+        size = self._size
+        for column in (self._timestamps, self._players, self._damages, self._flags):
+            column[index:size - 1] = column[index + 1:size]
+        self._size = size - 1
+        return event
+    
+    def clear(self):
+        self._size = 0
+    
+    def index_range(self, start: float, end: Optional[float] = None) -> Tuple[int, int]:
+        # 时间戳落在 [start, end) 内的事件下标区间
+        lo = int(np.searchsorted(self.timestamps, start, side='left'))
+        hi = self._size if end is None else int(np.searchsorted(self.timestamps, end, side='left'))
+        return lo, max(lo, hi)
+    
+    def between(self, start: float, end: Optional[float] = None) -> List[HitEvent]:
+        return self._records(*self.index_range(start, end))
@@ -0,0 +1,11 @@
+import shutil
+from typing import Optional
+
+
+def find_ffmpeg() -> Optional[str]:
+    # 优先使用 imageio-ffmpeg 自带的可执行文件，其次是 PATH 中的 ffmpeg
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        return shutil.which('ffmpeg')
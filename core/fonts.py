@@ -0,0 +1,87 @@
+import os
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+
+FONTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets", "fonts")
+FONT_EXTENSIONS = ('.ttf', '.otf', '.ttc')
+
+
+class FontRegistry:
+    
+    def __init__(self, fonts_dir: str = FONTS_DIR):
+        self.fonts_dir = fonts_dir
+        
+        self._fonts: Dict[Tuple[str, int], ImageFont.ImageFont] = {}
+        self._bboxes: Dict[Tuple[str, int, str], Tuple[int, int, int, int]] = {}
+        self._bitmaps: Dict[Tuple[str, int, str, Tuple[int, ...]], Tuple[Image.Image, Tuple[int, int]]] = {}
+    
+    def __getstate__(self) -> dict:
+        # FreeType 字体对象不能跨进程传递，只保留配置，在子进程中按需重新加载
+        return {'fonts_dir': self.fonts_dir}
+    
+    def __setstate__(self, state: dict):
+        self.__init__(state['fonts_dir'])
+    
+    def bundled_fonts(self) -> List[str]:
+        if not os.path.isdir(self.fonts_dir):
+            return []
+        return sorted(
+            os.path.join(self.fonts_dir, name)
+            for name in os.listdir(self.fonts_dir)
+            if name.lower().endswith(FONT_EXTENSIONS)
+        )
+    
+    def _load(self, name: str, size: int) -> ImageFont.ImageFont:
+        # 查找顺序：assets/fonts 下的同名字体 -> 系统字体 -> 任意内置字体 -> Pillow 默认字体
+        candidates = [os.path.join(self.fonts_dir, name), name] + self.bundled_fonts()
+        for candidate in candidates:
+            try:
+                return ImageFont.truetype(candidate, size)
+            except OSError:
+                continue
+        return ImageFont.load_default()
+    
+    def get(self, name: str, size: int) -> ImageFont.ImageFont:
+        key = (name, size)
+        font = self._fonts.get(key)
+        if font is None:
+            font = self._load(name, size)
+            self._fonts[key] = font
+        return font
+    
+    def text_bbox(self, text: str, name: str, size: int) -> Tuple[int, int, int, int]:
+        key = (name, size, text)
+        bbox = self._bboxes.get(key)
+        if bbox is None:
+            scratch = ImageDraw.Draw(Image.new('L', (1, 1)))
+            bbox = tuple(int(v) for v in scratch.textbbox((0, 0), text, font=self.get(name, size)))
+            self._bboxes[key] = bbox
+        return bbox
+    
+    def text_bitmap(self, text: str, name: str, size: int, fill: Tuple[int, ...]) -> Optional[Tuple[Image.Image, Tuple[int, int]]]:
+        # 返回透明底的文字图像及其相对绘制原点的偏移，粘贴结果与直接 draw.text 一致
+        key = (name, size, text, fill)
+        if key in self._bitmaps:
+            return self._bitmaps[key]
+        
+        left, top, right, bottom = self.text_bbox(text, name, size)
+        bitmap = None
+        if right > left and bottom > top:
+            image = Image.new('RGBA', (right - left, bottom - top), (0, 0, 0, 0))
+            ImageDraw.Draw(image, 'RGBA').text((-left, -top), text, fill=fill, font=self.get(name, size))
+            bitmap = (image, (left, top))
+        
+        self._bitmaps[key] = bitmap
+        return bitmap
+
+
+_default_registry: Optional[FontRegistry] = None
+
+
+def get_font_registry() -> FontRegistry:
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = FontRegistry()
+    return _default_registry
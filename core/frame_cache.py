@@ -0,0 +1,132 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+FrameKey = Tuple[str, int, Optional[int]]
+
+
+def resize_to_width(frame: np.ndarray, width: Optional[int]) -> np.ndarray:
+    if width is None or width >= frame.shape[1]:
+        return frame
+    height = max(1, round(frame.shape[0] * width / frame.shape[1]))
+    return cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+
+
+class FrameCache:
+    
+    def __init__(self, budget_bytes: int = 512 * 1024 * 1024):
+        self.budget_bytes = budget_bytes
+        
+        self._lock = threading.Lock()
+        self._frames: "OrderedDict[FrameKey, np.ndarray]" = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+    
+    def __len__(self) -> int:
+        return len(self._frames)
+    
+    def __contains__(self, key: FrameKey) -> bool:
+        with self._lock:
+            return key in self._frames
+    
+    def get(self, key: FrameKey) -> Optional[np.ndarray]:
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is None:
+                self.misses += 1
+                return None
+            self._frames.move_to_end(key)
+            self.hits += 1
+            return frame
+    
+    def put(self, key: FrameKey, frame: np.ndarray):
+        # 缓存中的帧是共享的，设为只读避免调用方原地修改
+        frame.setflags(write=False)
+        with self._lock:
+            old = self._frames.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            self._frames[key] = frame
+            self.nbytes += frame.nbytes
+            self._evict()
+    
+    def set_budget(self, budget_bytes: int):
+        with self._lock:
+            self.budget_bytes = budget_bytes
+            self._evict()
+    
+    def _evict(self):
+        # 至少保留最近放入的一帧，预算小于单帧时也能正常工作
+        while self.nbytes > self.budget_bytes and len(self._frames) > 1:
+            _, frame = self._frames.popitem(last=False)
+            self.nbytes -= frame.nbytes
+    
+    def clear(self, video_path: Optional[str] = None):
+        with self._lock:
+            if video_path is None:
+                self._frames.clear()
+                self.nbytes = 0
+                return
+            for key in [k for k in self._frames if k[0] == video_path]:
+                self.nbytes -= self._frames.pop(key).nbytes
+    
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'frames': len(self._frames),
+                'bytes': self.nbytes,
+                'budget': self.budget_bytes,
+                'hit_ratio': self.hits / total if total else 0.0
+            }
+
+
+class FramePrefetcher:
+    
+    def __init__(self, cache: FrameCache, loader: Callable[[str, int, Optional[int]], Optional[np.ndarray]], radius: int = 10):
+        self.cache = cache
+        self.loader = loader
+        self.radius = radius
+        
+        self._target: Optional[Tuple[str, int, int, Optional[int]]] = None
+        self._wakeup = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="frame-prefetch", daemon=True)
+        self._thread.start()
+    
+    def request(self, video_path: str, center: int, total_frames: int, width: Optional[int] = None):
+        # 只保留最新的目标，光标移动后旧目标上未完成的预取直接放弃
+        with self._wakeup:
+            self._target = (video_path, center, total_frames, width)
+            self._wakeup.notify()
+    
+    def _plan(self, center: int, total_frames: int) -> list:
+        # 先顺序读取光标之后的帧，再从 center - radius 起顺序读取之前的帧，每段只需一次 seek
+        after = range(center + 1, min(total_frames, center + self.radius + 1))
+        before = range(max(0, center - self.radius), center)
+        return list(after) + list(before)
+    
+    def _run(self):
+        while True:
+            with self._wakeup:
+                while self._target is None:
+                    self._wakeup.wait()
+                target = self._target
+                self._target = None
+            
+            video_path, center, total_frames, width = target
+            for frame_idx in self._plan(center, total_frames):
+                with self._wakeup:
+                    if self._target is not None:
+                        break
+                key = (video_path, frame_idx, width)
+                if key in self.cache:
+                    continue
+                frame = self.loader(video_path, frame_idx, width)
+                if frame is None:
+                    break
+                self.cache.put(key, frame)
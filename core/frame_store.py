@@ -0,0 +1,143 @@
+import os
+import shutil
+import struct
+from typing import Callable, Iterator, Optional
+
+import cv2
+import numpy as np
+
+from core.frame_cache import resize_to_width
+from core.video_index import load_index
+
+
+FRAME_STORE_DIR = "output/frames"
+FRAME_STORE_MAGIC = b'FHF1'
+
+# 文件头：魔数, 帧数, 高, 宽, 通道数, 帧率；补齐到 64 字节，其后是逐帧连续存放的 RGB 像素
+FRAME_STORE_HEADER = struct.Struct('<4sIIIId')
+HEADER_SIZE = 64
+
+# 只有解码后的体积在预算内、且写入后磁盘仍留有余量时才生成
+DEFAULT_BUDGET_BYTES = 4 * 1024 ** 3
+DISK_RESERVE_BYTES = 1024 ** 3
+
+
+def frame_store_path(video_path: str, width: Optional[int] = None, store_dir: str = FRAME_STORE_DIR) -> str:
+    video_name = os.path.splitext(os.path.basename(video_path))[0]
+    suffix = f"{width}w" if width else "full"
+    return os.path.join(store_dir, f"{video_name}_{suffix}.frames")
+
+
+def _store_size(source_width: int, source_height: int, width: Optional[int]):
+    # 与 resize_to_width 相同的尺寸计算
+    if width is None or width >= source_width:
+        return source_width, source_height
+    return width, max(1, round(source_height * width / source_width))
+
+
+def estimate_frame_store_bytes(total_frames: int, source_width: int, source_height: int, width: Optional[int] = None) -> int:
+    w, h = _store_size(source_width, source_height, width)
+    return HEADER_SIZE + total_frames * h * w * 3
+
+
+def frame_store_fits(size_bytes: int, budget_bytes: int = DEFAULT_BUDGET_BYTES, store_dir: str = FRAME_STORE_DIR) -> bool:
+    os.makedirs(store_dir, exist_ok=True)
+    return size_bytes <= budget_bytes and size_bytes + DISK_RESERVE_BYTES <= shutil.disk_usage(store_dir).free
+
+
+class FrameStore:
+    
+    # 一次性解码后的帧数组，只读内存映射；随机访问只是一次页缓存读取，不再经过解码器
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(FRAME_STORE_HEADER.size)
+        if len(header) < FRAME_STORE_HEADER.size:
+            raise ValueError(f"帧存储文件不完整: {path}")
+        magic, count, height, width, channels, self.fps = FRAME_STORE_HEADER.unpack(header)
+        if magic != FRAME_STORE_MAGIC:
+            raise ValueError(f"不是帧存储文件: {path}")
+        if os.path.getsize(path) < HEADER_SIZE + count * height * width * channels:
+            raise ValueError(f"帧存储文件不完整: {path}")
+        self.width = width
+        self.height = height
+        self.frames = np.memmap(path, dtype=np.uint8, mode='r', offset=HEADER_SIZE, shape=(count, height, width, channels))
+    
+    def __len__(self) -> int:
+        return len(self.frames)
+    
+    def __getitem__(self, frame_idx: int) -> np.ndarray:
+        # 零拷贝切片，调用方不能修改
+        return self.frames[frame_idx]
+    
+    def bgr_frames(self, start: int, count: int, on_missing: Optional[Callable[[int], None]] = None) -> Iterator[np.ndarray]:
+        # 导出用：转成可原地合成 HUD 的 BGR 新数组；超出存储范围的帧与 read_frames 一样填充灰色
+        for i, frame_idx in enumerate(range(start, start + count)):
+            if frame_idx < len(self.frames):
+                yield cv2.cvtColor(self.frames[frame_idx], cv2.COLOR_RGB2BGR)
+            else:
+                if on_missing:
+                    on_missing(i)
+                yield np.full((self.height, self.width, 3), 20, dtype=np.uint8)
+
+
+def open_frame_store(video_path: str, width: Optional[int] = None, store_dir: str = FRAME_STORE_DIR) -> Optional[FrameStore]:
+    # 比源视频旧的帧存储视为失效
+    path = frame_store_path(video_path, width, store_dir)
+    try:
+        if os.path.getmtime(path) < os.path.getmtime(video_path):
+            return None
+        return FrameStore(path)
+    except (OSError, ValueError):
+        return None
+
+
+def build_frame_store(video_path: str, width: Optional[int] = None, budget_bytes: int = DEFAULT_BUDGET_BYTES,
+                      store_dir: str = FRAME_STORE_DIR, progress_callback: Optional[Callable[[float], None]] = None) -> str:
+    # 帧数以关键帧索引实际扫描到的为准，容器头里的帧数可能偏大或偏小
+    total_frames = load_index(video_path).frame_count
+    
+    # 与预览、导出相同的 OpenCV 解码与缩放，保证从存储读出的帧和直接解码的逐像素一致
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 60.0
+    w, h = _store_size(int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), width)
+    
+    size_bytes = HEADER_SIZE + total_frames * h * w * 3
+    if not frame_store_fits(size_bytes, budget_bytes, store_dir):
+        cap.release()
+        raise ValueError(f"帧存储需要 {size_bytes / (1024 * 1024):.0f} MB，超出预算或磁盘剩余空间")
+    
+    output_path = frame_store_path(video_path, width, store_dir)
+    temp_path = output_path + '.part'
+    written = 0
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(bytes(HEADER_SIZE))
+            while written < total_frames:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                frame = resize_to_width(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), width)
+                f.write(memoryview(np.ascontiguousarray(frame)).cast('B'))
+                written += 1
+                if progress_callback and written % 30 == 0:
+                    progress_callback(min(1.0, written / total_frames))
+            
+            # 解码提前结束时文件头里回填实际写入的帧数，不足索引帧数的存储导出时不会使用
+            f.seek(0)
+            f.write(FRAME_STORE_HEADER.pack(FRAME_STORE_MAGIC, written, h, w, 3, fps))
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    finally:
+        cap.release()
+    
+    if written == 0:
+        os.remove(temp_path)
+        raise RuntimeError(f"无法读取视频: {video_path}")
+    os.replace(temp_path, output_path)
+    
+    if progress_callback:
+        progress_callback(1.0)
+    return output_path
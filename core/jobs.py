@@ -0,0 +1,303 @@
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+from core.detector import candidates_path, detect_hits, save_candidates
+from core.engine import FightStateEngine
+from core.frame_store import build_frame_store, frame_store_path
+from core.events import EventStore
+from core.match_store import MatchStore
+from core.pipeline import stats_to_dict
+from core.processor import probe_indexed, probe_video, render_overlay, render_video, segment_cache_dir
+from core.proxy import build_playback_proxy, build_proxy, playback_path, proxy_path, proxy_width
+from core.renderer import SF6Renderer
+from core.thumbnails import build_thumbnails, thumbnails_path
+from core.video_index import load_index
+
+
+# 进度和统计的更新最多每隔这么久写一次任务表；状态变化总是立即写入
+SAVE_INTERVAL = 0.5
+
+
+class JobCancelled(Exception):
+    pass
+
+
+@dataclass
+class RenderJob:
+    job_id: str
+    video_path: str
+    output_path: str
+    events: List[Dict]
+    match_json: Optional[str] = None
+    p1_id: str = "P1"
+    p2_id: str = "P2"
+    mode: str = 'video'
+    workers: Optional[int] = None
+    proxy_width: Optional[int] = None
+    thumb_step: Optional[int] = None
+    status: str = 'queued'
+    progress: float = 0.0
+    error: Optional[str] = None
+    stats: Optional[Dict] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+
+class RenderJobQueue:
+    
+    def __init__(self, table_path: str = "output/jobs.json", max_concurrent: int = 1, workers_per_job: Optional[int] = None):
+        self.table_path = table_path
+        self.max_concurrent = max(1, max_concurrent)
+        self.workers_per_job = workers_per_job or max(1, (os.cpu_count() or 1) // self.max_concurrent)
+        
+        self._lock = threading.RLock()
+        self._wakeup = threading.Condition(self._lock)
+        self._cancel_flags: Dict[str, threading.Event] = {}
+        self._last_save = 0.0
+        self.jobs: Dict[str, RenderJob] = self._load()
+        
+        # 上次进程退出时仍在运行的任务重新排队
+        for job in self.jobs.values():
+            if job.status == 'running':
+                job.status = 'queued'
+                job.progress = 0.0
+        self._save()
+        
+        self._threads = [
+            threading.Thread(target=self._worker_loop, name=f"render-job-{i}", daemon=True)
+            for i in range(self.max_concurrent)
+        ]
+        for thread in self._threads:
+            thread.start()
+    
+    def _load(self) -> Dict[str, RenderJob]:
+        if not os.path.exists(self.table_path):
+            return {}
+        try:
+            with open(self.table_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return {item['job_id']: RenderJob(**item) for item in data.get('jobs', [])}
+    
+    def _save(self):
+        with self._lock:
+            data = {'jobs': [asdict(job) for job in self.jobs.values()]}
+            directory = os.path.dirname(self.table_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = self.table_path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+            os.replace(temp_path, self.table_path)
+            self._last_save = time.monotonic()
+    
+    def _update(self, job: RenderJob, **changes):
+        with self._lock:
+            for key, value in changes.items():
+                setattr(job, key, value)
+            job.updated_at = time.time()
+            # 内存中的状态随时可读，只有写盘被节流；任务结束时的状态变化会把最新进度一并写入
+            if 'status' in changes or time.monotonic() - self._last_save >= SAVE_INTERVAL:
+                self._save()
+    
+    def submit(self, video_path: str, output_path: str, events: Optional[List[Dict]] = None, match_json: Optional[str] = None,
+               p1_id: str = "P1", p2_id: str = "P2", mode: str = 'video', workers: Optional[int] = None) -> str:
+        # 提交时固化事件快照，之后继续打点不会影响已排队的任务
+        if events is None:
+            if not match_json:
+                raise ValueError("需要提供事件列表或比赛 JSON")
+            events = MatchStore(match_json).load().to_dicts()
+        
+        return self._enqueue(RenderJob(
+            job_id=uuid.uuid4().hex[:12],
+            video_path=video_path,
+            output_path=output_path,
+            events=list(events),
+            match_json=match_json,
+            p1_id=p1_id,
+            p2_id=p2_id,
+            mode=mode,
+            workers=workers
+        ))
+    
+    def submit_proxy(self, video_path: str, width: int) -> str:
+        width = proxy_width(width)
+        return self._enqueue(RenderJob(
+            job_id=uuid.uuid4().hex[:12],
+            video_path=video_path,
+            output_path=proxy_path(video_path, width),
+            events=[],
+            mode='proxy',
+            proxy_width=width
+        ))
+    
+    def submit_playback(self, video_path: str, width: int) -> str:
+        return self._enqueue(RenderJob(
+            job_id=uuid.uuid4().hex[:12],
+            video_path=video_path,
+            output_path=playback_path(video_path, width),
+            events=[],
+            mode='playback',
+            proxy_width=width
+        ))
+    
+    def submit_frame_store(self, video_path: str, width: Optional[int] = None) -> str:
+        return self._enqueue(RenderJob(
+            job_id=uuid.uuid4().hex[:12],
+            video_path=video_path,
+            output_path=frame_store_path(video_path, width),
+            events=[],
+            mode='frames',
+            proxy_width=width
+        ))
+    
+    def submit_detect(self, video_path: str) -> str:
+        return self._enqueue(RenderJob(
+            job_id=uuid.uuid4().hex[:12],
+            video_path=video_path,
+            output_path=candidates_path(video_path),
+            events=[],
+            mode='detect'
+        ))
+    
+    def submit_thumbnails(self, video_path: str, step: int) -> str:
+        return self._enqueue(RenderJob(
+            job_id=uuid.uuid4().hex[:12],
+            video_path=video_path,
+            output_path=thumbnails_path(video_path, step),
+            events=[],
+            mode='thumbs',
+            thumb_step=step
+        ))
+    
+    def _enqueue(self, job: RenderJob) -> str:
+        with self._wakeup:
+            self.jobs[job.job_id] = job
+            self._save()
+            self._wakeup.notify()
+        return job.job_id
+    
+    def cancel(self, job_id: str):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            if job.status == 'queued':
+                self._update(job, status='cancelled')
+            elif job.status == 'running':
+                self._cancel_flags[job_id].set()
+    
+    def resume(self, job_id: str):
+        with self._wakeup:
+            job = self.jobs.get(job_id)
+            if job is not None and job.status in ('failed', 'cancelled'):
+                self._update(job, status='queued', progress=0.0, error=None, stats=None)
+                self._wakeup.notify()
+    
+    def remove(self, job_id: str):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is not None and job.status != 'running':
+                del self.jobs[job_id]
+                self._save()
+    
+    def list_jobs(self) -> List[RenderJob]:
+        with self._lock:
+            return sorted(self.jobs.values(), key=lambda job: job.created_at, reverse=True)
+    
+    def _resources(self, job: RenderJob) -> set:
+        # 同一输出路径、以及共用同一分段缓存目录的导出任务不能同时运行：
+        # 后者会在结束时清理缓存中本次未用到的分段，删掉另一个任务正要拼接的文件
+        resources = {('output', os.path.abspath(job.output_path))}
+        if job.mode == 'video':
+            video_name = os.path.splitext(os.path.basename(job.video_path))[0]
+            resources.add(('segments', os.path.abspath(segment_cache_dir(os.path.dirname(job.output_path) or ".", video_name))))
+        return resources
+    
+    def _next_job(self) -> RenderJob:
+        with self._wakeup:
+            while True:
+                busy = set()
+                for job in self.jobs.values():
+                    if job.status == 'running':
+                        busy |= self._resources(job)
+                queued = [job for job in self.jobs.values() if job.status == 'queued' and not self._resources(job) & busy]
+                if queued:
+                    job = min(queued, key=lambda j: j.created_at)
+                    self._cancel_flags[job.job_id] = threading.Event()
+                    self._update(job, status='running', progress=0.0, error=None)
+                    return job
+                self._wakeup.wait()
+    
+    def _worker_loop(self):
+        while True:
+            job = self._next_job()
+            cancel_flag = self._cancel_flags[job.job_id]
+            try:
+                self._run(job, cancel_flag)
+                self._update(job, status='done', progress=1.0)
+            except JobCancelled:
+                self._update(job, status='cancelled')
+            except Exception as e:
+                self._update(job, status='failed', error=f"{e}\n{traceback.format_exc(limit=5)}")
+            finally:
+                with self._wakeup:
+                    self._cancel_flags.pop(job.job_id, None)
+                    # 与它冲突而等待的任务现在可以开始了
+                    self._wakeup.notify_all()
+    
+    def _run(self, job: RenderJob, cancel_flag: threading.Event):
+        def on_progress(progress: float):
+            if cancel_flag.is_set():
+                raise JobCancelled()
+            self._update(job, progress=progress)
+        
+        if job.mode == 'proxy':
+            job.output_path = build_proxy(job.video_path, job.proxy_width, progress_callback=on_progress)
+            return
+        
+        if job.mode == 'playback':
+            job.output_path = build_playback_proxy(job.video_path, job.proxy_width, progress_callback=on_progress)
+            return
+        
+        if job.mode == 'frames':
+            job.output_path = build_frame_store(job.video_path, job.proxy_width, progress_callback=on_progress)
+            return
+        
+        if job.mode == 'detect':
+            save_candidates(job.output_path, detect_hits(job.video_path, progress_callback=on_progress))
+            return
+        
+        if job.mode == 'thumbs':
+            job.output_path = build_thumbnails(job.video_path, job.thumb_step, progress_callback=on_progress)
+            return
+        
+        if job.mode == 'video':
+            video_info, index = probe_indexed(job.video_path)
+        else:
+            # 仅 HUD 输出完全不解码原视频：没有 ffmpeg 时建索引要逐帧 grab，这里只读容器元数据，已有索引时才用它的帧数
+            video_info, index = probe_video(job.video_path), load_index(job.video_path, rebuild=False)
+            if index is not None and index.frame_count > 0:
+                video_info = (index.frame_count,) + video_info[1:]
+        total_frames, fps, width, height = video_info
+        
+        engine = FightStateEngine(fps=fps)
+        engine.set_events(EventStore.from_dicts(job.events))
+        renderer = SF6Renderer(width=width, height=height)
+        
+        if job.mode == 'video':
+            video_name = os.path.splitext(os.path.basename(job.video_path))[0]
+            render_video(job.video_path, engine, renderer, job.output_path, job.p1_id, job.p2_id,
+                         workers=min(job.workers or self.workers_per_job, self.workers_per_job), progress_callback=on_progress,
+                         stats_callback=lambda stats: self._update(job, stats=stats_to_dict(stats)),
+                         cache_dir=segment_cache_dir(os.path.dirname(job.output_path) or ".", video_name), index=index)
+        else:
+            render_overlay(video_info, engine, renderer, job.output_path, job.p1_id, job.p2_id,
+                           fmt=job.mode, progress_callback=on_progress)
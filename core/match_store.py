@@ -0,0 +1,209 @@
+import json
+import os
+import shutil
+import struct
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from core.events import FLAG_SUPER, EventStore, HitEvent
+
+
+JOURNAL_MAGIC = b'FHJ1'
+SNAPSHOT_MAGIC = b'FHS1'
+
+# 日志文件头：魔数 + 对应的快照代数；记录定长，末尾写了一半的记录在加载时丢弃
+JOURNAL_HEADER = struct.Struct('<4sI')
+JOURNAL_RECORD = struct.Struct('<BdbdBi')
+
+OP_ADD = 1
+OP_DELETE = 2
+OP_EDIT = 3
+
+# 二进制快照：魔数, 代数, 元数据长度, 事件数；其后是 UTF-8 元数据 JSON 和打包的事件记录
+SNAPSHOT_HEADER = struct.Struct('<4sIII')
+SNAPSHOT_DTYPE = np.dtype([('timestamp', '<f8'), ('player', 'i1'), ('damage', '<f8'), ('flags', 'u1')])
+
+SNAPSHOT_FORMATS = ('json', 'binary')
+
+
+def match_paths(json_path: str) -> Tuple[str, str]:
+    # 同一场比赛的二进制快照与操作日志放在 JSON 旁边
+    base = os.path.splitext(json_path)[0]
+    return base + '.match.bin', base + '.journal'
+
+
+def match_exists(json_path: str) -> bool:
+    return os.path.exists(json_path) or os.path.exists(match_paths(json_path)[0])
+
+
+def _write_atomic(path: str, data: bytes):
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+class MatchStore:
+    
+    # 比赛事件的持久化：快照 + 只追加的操作日志
+    # 每次打点只往日志末尾写一条定长记录；日志积累到 compact_every 条后合并成新快照并清空日志
+    # 日志头记录它所基于的快照代数，合并过程中途退出时旧日志与新快照代数不符，加载时自动忽略
+    def __init__(self, json_path: str, snapshot_format: str = 'json', compact_every: int = 256):
+        if snapshot_format not in SNAPSHOT_FORMATS:
+            raise ValueError(f"未知的快照格式: {snapshot_format}")
+        self.json_path = json_path
+        self.binary_path, self.journal_path = match_paths(json_path)
+        self.snapshot_format = snapshot_format
+        self.compact_every = compact_every
+        
+        # 快照中 hits 以外的字段（如 p1_id/p2_id），合并时原样写回
+        self.meta: Dict = {}
+        self.generation = 0
+        self.journal_records = 0
+    
+    def exists(self) -> bool:
+        return match_exists(self.json_path)
+    
+    def _read_json(self) -> Tuple[EventStore, Dict, int]:
+        with open(self.json_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        events = EventStore.from_dicts(data.pop('hits', []))
+        generation = int(data.pop('journal_generation', 0))
+        return events, data, generation
+    
+    def _read_binary(self) -> Tuple[EventStore, Dict, int]:
+        with open(self.binary_path, 'rb') as f:
+            data = f.read()
+        magic, generation, meta_length, count = SNAPSHOT_HEADER.unpack_from(data)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"不是比赛快照文件: {self.binary_path}")
+        offset = SNAPSHOT_HEADER.size
+        meta = json.loads(data[offset:offset + meta_length].decode('utf-8'))
+        records = np.frombuffer(data, dtype=SNAPSHOT_DTYPE, count=count, offset=offset + meta_length)
+        events = EventStore.from_columns(records['timestamp'], records['player'], records['damage'],
+                                         (records['flags'] & FLAG_SUPER) != 0)
+        return events, meta, generation
+    
+    def _journal_generation(self) -> Optional[int]:
+        try:
+            with open(self.journal_path, 'rb') as f:
+                header = f.read(JOURNAL_HEADER.size)
+        except OSError:
+            return None
+        if len(header) < JOURNAL_HEADER.size:
+            return None
+        magic, generation = JOURNAL_HEADER.unpack(header)
+        return generation if magic == JOURNAL_MAGIC else None
+    
+    def _read_snapshot(self) -> Tuple[EventStore, Dict, int]:
+        # 优先读当前格式；它的代数落后于日志时说明另一种格式更新（切换过格式），再读另一份取代数较大的
+        readers = [(self.json_path, self._read_json), (self.binary_path, self._read_binary)]
+        if self.snapshot_format == 'binary':
+            readers.reverse()
+        readers = [reader for path, reader in readers if os.path.exists(path)]
+        if not readers:
+            return EventStore(), {}, 0
+        
+        best = readers[0]()
+        journal_generation = self._journal_generation()
+        if journal_generation is not None and best[2] >= journal_generation:
+            return best
+        for reader in readers[1:]:
+            snapshot = reader()
+            if snapshot[2] > best[2]:
+                best = snapshot
+        return best
+    
+    def _replay(self, events: EventStore) -> Tuple[int, bytes]:
+        # 返回重放的记录数与日志中有效的前缀
+        header = JOURNAL_HEADER.pack(JOURNAL_MAGIC, self.generation)
+        try:
+            with open(self.journal_path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return 0, header
+        if len(data) < JOURNAL_HEADER.size or data[:JOURNAL_HEADER.size] != header:
+            return 0, header
+        
+        count = (len(data) - JOURNAL_HEADER.size) // JOURNAL_RECORD.size
+        valid = data[:JOURNAL_HEADER.size + count * JOURNAL_RECORD.size]
+        for op, timestamp, player, damage, flags, index in JOURNAL_RECORD.iter_unpack(valid[JOURNAL_HEADER.size:]):
+            if op in (OP_DELETE, OP_EDIT):
+                events.remove(index)
+            if op in (OP_ADD, OP_EDIT):
+                events.insert(timestamp, player, damage, bool(flags & FLAG_SUPER))
+        return count, valid
+    
+    def load(self) -> EventStore:
+        events, self.meta, self.generation = self._read_snapshot()
+        self.journal_records, valid = self._replay(events)
+        
+        # 过期日志（合并中途退出）或末尾残缺的记录要先清理，否则之后追加的记录会错位或被忽略
+        if os.path.exists(self.journal_path) and os.path.getsize(self.journal_path) != len(valid):
+            _write_atomic(self.journal_path, valid)
+        return events
+    
+    def _append(self, op: int, index: int = 0, event: Optional[HitEvent] = None):
+        if event is None:
+            record = JOURNAL_RECORD.pack(op, 0.0, 0, 0.0, 0, index)
+        else:
+            record = JOURNAL_RECORD.pack(op, event.timestamp, event.player, event.damage,
+                                         FLAG_SUPER if event.is_super else 0, index)
+        
+        os.makedirs(os.path.dirname(self.journal_path) or ".", exist_ok=True)
+        with open(self.journal_path, 'ab') as f:
+            if f.tell() == 0:
+                f.write(JOURNAL_HEADER.pack(JOURNAL_MAGIC, self.generation))
+            f.write(record)
+        self.journal_records += 1
+    
+    def log_add(self, event: HitEvent):
+        self._append(OP_ADD, event=event)
+    
+    def log_delete(self, index: int):
+        self._append(OP_DELETE, index=index)
+    
+    def log_edit(self, index: int, event: HitEvent):
+        self._append(OP_EDIT, index=index, event=event)
+    
+    def needs_compaction(self) -> bool:
+        return self.journal_records >= self.compact_every
+    
+    def compact(self, events: EventStore):
+        generation = self.generation + 1
+        os.makedirs(os.path.dirname(self.json_path) or ".", exist_ok=True)
+        
+        if self.snapshot_format == 'binary':
+            self._write_binary(events, generation)
+        else:
+            self._write_json(events, generation, self.json_path)
+        
+        # 新快照落盘后再换成空日志；两步之间退出时旧日志因代数不符被忽略
+        self.generation = generation
+        _write_atomic(self.journal_path, JOURNAL_HEADER.pack(JOURNAL_MAGIC, generation))
+        self.journal_records = 0
+    
+    def _write_json(self, events: EventStore, generation: int, path: str):
+        data = dict(self.meta)
+        data['hits'] = events.to_dicts()
+        data['journal_generation'] = generation
+        # 只在合并时备份上一版快照，而不是每次打点
+        if os.path.exists(path):
+            shutil.copy2(path, path + '.bak')
+        _write_atomic(path, json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8'))
+    
+    def _write_binary(self, events: EventStore, generation: int):
+        records = np.empty(len(events), dtype=SNAPSHOT_DTYPE)
+        records['timestamp'] = events.timestamps
+        records['player'] = events.players
+        records['damage'] = events.damages
+        records['flags'] = np.where(events.supers, FLAG_SUPER, 0)
+        meta = json.dumps(self.meta, ensure_ascii=False).encode('utf-8')
+        _write_atomic(self.binary_path, SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, generation, len(meta), len(records)) + meta + records.tobytes())
+    
+    def export_json(self, events: EventStore):
+        # 兼容导出：先合并，二进制模式下再写出同一代数的普通比赛 JSON，供只认 JSON 的工具读取
+        self.compact(events)
+        if self.snapshot_format == 'binary':
+            self._write_json(events, self.generation, self.json_path)
@@ -0,0 +1,159 @@
+import queue
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+_END = object()
+
+
+@dataclass
+class StageStats:
+    name: str
+    items: int = 0
+    # 阶段函数本身的耗时
+    busy: float = 0.0
+    # 等待上游供给（饥饿）与等待下游腾出队列（背压）的时间
+    starved: float = 0.0
+    blocked: float = 0.0
+    # 阶段内部的记忆缓存命中/未命中次数（合成阶段为 HUD 记忆）
+    cache_hits: int = 0
+    cache_misses: int = 0
+    # 源视频读取失败、以灰帧补齐的帧数
+    missing: int = 0
+    
+    @property
+    def fps(self) -> float:
+        return self.items / self.busy if self.busy > 0 else 0.0
+    
+    @property
+    def hit_ratio(self) -> float:
+        total = self.cache_hits + self.cache_misses
+        return self.cache_hits / total if total else 0.0
+    
+    def merge(self, other: 'StageStats'):
+        self.items += other.items
+        self.busy += other.busy
+        self.starved += other.starved
+        self.blocked += other.blocked
+        self.cache_hits += other.cache_hits
+        self.cache_misses += other.cache_misses
+        self.missing += other.missing
+
+
+def read_frames(cap: cv2.VideoCapture, count: int, size: Tuple[int, int],
+                on_missing: Optional[Callable[[int], None]] = None) -> Iterator[np.ndarray]:
+    width, height = size
+    for i in range(count):
+        ret, frame = cap.read()
+        if not ret:
+            frame = np.full((height, width, 3), 20, dtype=np.uint8)
+            if on_missing:
+                on_missing(i)
+        yield frame
+
+
+class FramePipeline:
+    
+    # 解码、各处理阶段和编码各占一个线程，用有界队列串联；OpenCV 解码和编码管道写入都会释放 GIL
+    def __init__(self, source: Iterable, stages: List[Tuple[str, Callable]], sink: Tuple[str, Callable], depth: int = 4,
+                 source_name: str = 'decode'):
+        self.source = source
+        self.stages = stages
+        self.sink = sink
+        self.depth = max(1, depth)
+        self.source_name = source_name
+        
+        self.stats: Dict[str, StageStats] = {}
+        self._error: Optional[BaseException] = None
+        self._stop = threading.Event()
+    
+    def _put(self, out_queue: queue.Queue, item, stats: StageStats) -> bool:
+        start = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                out_queue.put(item, timeout=0.1)
+                stats.blocked += time.perf_counter() - start
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def _get(self, in_queue: queue.Queue, stats: StageStats):
+        start = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                item = in_queue.get(timeout=0.1)
+                stats.starved += time.perf_counter() - start
+                return item
+            except queue.Empty:
+                continue
+        return _END
+    
+    def _fail(self, error: BaseException):
+        if self._error is None:
+            self._error = error
+        self._stop.set()
+    
+    def _run_source(self, out_queue: queue.Queue, stats: StageStats):
+        try:
+            iterator = iter(self.source)
+            while not self._stop.is_set():
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                stats.busy += time.perf_counter() - start
+                stats.items += 1
+                if not self._put(out_queue, item, stats):
+                    return
+            self._put(out_queue, _END, stats)
+        except BaseException as e:
+            self._fail(e)
+    
+    def _run_stage(self, fn: Callable, in_queue: queue.Queue, out_queue: Optional[queue.Queue], stats: StageStats):
+        try:
+            while True:
+                item = self._get(in_queue, stats)
+                if item is _END:
+                    if out_queue is not None:
+                        self._put(out_queue, _END, stats)
+                    return
+                start = time.perf_counter()
+                result = fn(item)
+                stats.busy += time.perf_counter() - start
+                stats.items += 1
+                if out_queue is not None and not self._put(out_queue, result, stats):
+                    return
+        except BaseException as e:
+            self._fail(e)
+    
+    def run(self) -> Dict[str, StageStats]:
+        names = [self.source_name] + [name for name, _ in self.stages] + [self.sink[0]]
+        self.stats = {name: StageStats(name) for name in names}
+        queues = [queue.Queue(maxsize=self.depth) for _ in range(len(self.stages) + 1)]
+        
+        threads = [threading.Thread(target=self._run_source, args=(queues[0], self.stats[self.source_name]), daemon=True)]
+        for i, (name, fn) in enumerate(self.stages):
+            threads.append(threading.Thread(target=self._run_stage, args=(fn, queues[i], queues[i + 1], self.stats[name]), daemon=True))
+        for thread in threads:
+            thread.start()
+        
+        # 编码阶段直接在调用线程执行，少开一个线程
+        self._run_stage(self.sink[1], queues[-1], None, self.stats[self.sink[0]])
+        self._stop.set()
+        for thread in threads:
+            thread.join()
+        
+        if self._error is not None:
+            raise self._error
+        return self.stats
+
+
+def stats_to_dict(stats: Dict[str, StageStats]) -> Dict[str, dict]:
+    return {name: dict(asdict(s), fps=s.fps, hit_ratio=s.hit_ratio) for name, s in stats.items()}
@@ -0,0 +1,53 @@
+from typing import Dict
+
+import numpy as np
+
+from core.renderer import SF6Renderer
+
+
+# 浏览器端播放用的逐帧 HUD 状态，每帧一行 int16：
+# P1 主血宽, P1 红槽宽, P2 主血宽, P2 红槽宽, P1 驱动格, P2 驱动格, 水平抖动
+TIMELINE_COLUMNS = 7
+TIMELINE_DTYPE = np.dtype('<i2')
+
+
+def hud_layout(renderer: SF6Renderer, p1_id: str, p2_id: str) -> Dict:
+    # 浏览器端按同样的几何在视频原始分辨率的画布上绘制 HUD，再随视频一起缩放
+    return {
+        'width': renderer.width,
+        'height': renderer.height,
+        'bar_width': renderer.bar_width,
+        'bar_height': renderer.bar_height,
+        'bar_skew': renderer.bar_skew,
+        'block_height': renderer.block_height,
+        'block_gap': renderer.block_gap,
+        'gauge_gap': renderer.gauge_gap,
+        'info_gap': renderer.info_gap,
+        'p1_x': renderer.p1_x,
+        'p2_x': renderer.p2_x,
+        'y_pos': renderer.y_pos,
+        'font_size': renderer.font_size,
+        'colors': {name: list(color) for name, color in renderer.colors.items()},
+        'outline': list(renderer.outline_color),
+        'p1_id': p1_id,
+        'p2_id': p2_id,
+        'columns': TIMELINE_COLUMNS,
+    }
+
+
+def _bar_widths(bar_width: int, display: np.ndarray, target: np.ndarray):
+    # 与 SF6Renderer._health_bar_pieces 相同的取整：先乘后除再向零截断
+    health = np.maximum(0, np.trunc(bar_width * target / 100))
+    damage = np.maximum(0, np.trunc(bar_width * (display - target) / 100))
+    return health, damage
+
+
+def build_playback_timeline(states: np.ndarray, renderer: SF6Renderer) -> bytes:
+    # states 是 build_hud_states 的结果，与导出使用同一条时间轴和抖动种子，浏览器里看到的 HUD 与最终渲染逐帧一致
+    packed = np.empty((len(states), TIMELINE_COLUMNS), dtype=TIMELINE_DTYPE)
+    packed[:, 0], packed[:, 1] = _bar_widths(renderer.bar_width, states[:, 1], states[:, 0])
+    packed[:, 2], packed[:, 3] = _bar_widths(renderer.bar_width, states[:, 3], states[:, 2])
+    packed[:, 4] = states[:, 4].astype(np.int64)
+    packed[:, 5] = states[:, 5].astype(np.int64)
+    packed[:, 6] = states[:, 6]
+    return packed.tobytes()
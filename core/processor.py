@@ -0,0 +1,454 @@
+import hashlib
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from fractions import Fraction
+from typing import Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from core.engine import FightStateEngine, FightTimeline
+from core.ffmpeg_utils import find_ffmpeg
+from core.frame_store import FrameStore, open_frame_store
+from core.pipeline import FramePipeline, StageStats, read_frames
+from core.renderer import SF6Renderer
+from core.video_index import VideoIndex, load_index, seek_capture
+
+
+# 仅 HUD 输出支持的格式：PNG 序列、ProRes 4444（带 alpha 的 .mov）、原始 RGBA 流
+OVERLAY_FORMATS = ('png', 'prores', 'rgba')
+
+# HUD 状态矩阵的列：p1 目标血量、p1 显示血量、p2 目标血量、p2 显示血量、p1 驱动槽、p2 驱动槽、水平抖动
+HUD_COLUMNS = 7
+
+
+def probe_video(video_path: str) -> Tuple[int, float, int, int]:
+    cap = cv2.VideoCapture(video_path)
+    try:
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = cap.get(cv2.CAP_PROP_FPS) or 60.0
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    finally:
+        cap.release()
+    return total_frames, fps, width, height
+
+
+def probe_indexed(video_path: str, data_dir: str = "data") -> Tuple[Tuple[int, float, int, int], VideoIndex]:
+    # 容器头里的帧数可能不准，导出的帧数以关键帧索引实际扫描到的为准
+    index = load_index(video_path, data_dir)
+    _, fps, width, height = probe_video(video_path)
+    return (index.frame_count, fps, width, height), index
+
+
+def seek_to_frame(cap: cv2.VideoCapture, frame_idx: int, index: Optional[VideoIndex]) -> Optional[np.ndarray]:
+    # 定位后顺序 grab 到目标帧；落点恰好是目标帧时直接返回已解码的这一帧
+    position, frame = seek_capture(cap, frame_idx, index)
+    if frame is not None:
+        return frame
+    for _ in range(frame_idx - position):
+        if not cap.grab():
+            break
+    return None
+
+
+class FFmpegWriter:
+    
+    # 与 cv2.VideoWriter 相同的 write/release 接口，原始 BGR 帧经管道直接送入一次 H.264 编码
+    def __init__(self, output_path: str, fps: float, size: Tuple[int, int], ffmpeg: str, crf: int = 18, preset: str = 'veryfast',
+                 pix_fmt: str = 'bgr24', codec_args: Optional[List[str]] = None):
+        width, height = size
+        rate = Fraction(fps).limit_denominator(1001)
+        if codec_args is None:
+            codec_args = ['-c:v', 'libx264', '-preset', preset, '-crf', str(crf), '-pix_fmt', 'yuv420p']
+        command = [
+            ffmpeg, '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', pix_fmt, '-s', f"{width}x{height}", '-r', f"{rate.numerator}/{rate.denominator}",
+            '-i', '-', '-an'
+        ] + codec_args + [output_path]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+    
+    def write(self, frame: np.ndarray):
+        self.process.stdin.write(memoryview(np.ascontiguousarray(frame)).cast('B'))
+    
+    def release(self):
+        if self.process.stdin and not self.process.stdin.closed:
+            self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise RuntimeError(f"ffmpeg 编码失败，退出码 {self.process.returncode}")
+
+
+def open_writer(output_path: str, fps: float, size: Tuple[int, int]):
+    ffmpeg = find_ffmpeg()
+    if ffmpeg:
+        return FFmpegWriter(output_path, fps, size, ffmpeg)
+    return cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+
+
+def build_hud_states(timeline: FightTimeline, seed: int = 0) -> np.ndarray:
+    states = np.empty((len(timeline), HUD_COLUMNS))
+    states[:, 0] = timeline.p1_hp_target
+    states[:, 1] = timeline.p1_hp_display
+    states[:, 2] = timeline.p2_hp_target
+    states[:, 3] = timeline.p2_hp_display
+    states[:, 4] = timeline.p1_drive
+    states[:, 5] = timeline.p2_drive
+    states[:, 6] = timeline.shake_offsets(seed)[:, 0]
+    return states
+
+
+def apply_hud_state(renderer: SF6Renderer, state: np.ndarray) -> Tuple[int, int]:
+    renderer.set_hp(1, state[0], state[1])
+    renderer.set_hp(2, state[2], state[3])
+    renderer.set_drive(1, int(state[4]))
+    renderer.set_drive(2, int(state[5]))
+    return int(state[6]), 0
+
+
+def render_segment(video_path: str, output_path: str, start: int, states: np.ndarray, renderer: SF6Renderer, p1_id: str, p2_id: str, fps: float,
+                   depth: int = 4, frame_store: Optional[str] = None, index: Optional[VideoIndex] = None) -> Tuple[str, int, Dict[str, StageStats]]:
+    cv2.setNumThreads(1)  # 并行由进程池负责，避免每个进程再开满线程
+    
+    # 有帧存储时直接切片读取，分段起点不需要 seek，也不经过解码器
+    cap = None
+    missing = []
+    if frame_store:
+        frames = FrameStore(frame_store).bgr_frames(start, len(states), missing.append)
+    else:
+        cap = cv2.VideoCapture(video_path)
+        first = seek_to_frame(cap, start, index) if start > 0 else None
+        size = (renderer.width, renderer.height)
+        if first is None:
+            frames = read_frames(cap, len(states), size, missing.append)
+        else:
+            frames = itertools.chain([first], read_frames(cap, len(states) - 1, size, missing.append))
+    
+    out = open_writer(output_path, fps, (renderer.width, renderer.height))
+    
+    # 帧号与状态一一对应，合成阶段只有一个线程，渲染器无需加锁
+    state_iter = iter(states)
+    
+    def composite(frame: np.ndarray) -> np.ndarray:
+        shake_offset = apply_hud_state(renderer, next(state_iter))
+        return renderer.render_bgr(frame, p1_id, p2_id, shake_offset)
+    
+    pipeline = FramePipeline(
+        frames,
+        [('composite', composite)],
+        ('encode', out.write),
+        depth=depth
+    )
+    
+    hits, misses = renderer.hud_memo_hits, renderer.hud_memo_misses
+    try:
+        stats = pipeline.run()
+    finally:
+        if cap is not None:
+            cap.release()
+        out.release()
+    
+    stats['composite'].cache_hits = renderer.hud_memo_hits - hits
+    stats['composite'].cache_misses = renderer.hud_memo_misses - misses
+    stats['decode'].missing = len(missing)
+    return output_path, len(states), stats
+
+
+def split_segments(total_frames: int, workers: int, fps: float) -> List[Tuple[int, int]]:
+    # 段数取进程数的 4 倍以均衡负载，但每段不少于 2 秒，避免拼接和 seek 开销占主导
+    min_frames = max(1, int(fps * 2))
+    segment_frames = max(min_frames, math.ceil(total_frames / max(1, workers * 4)))
+    return [(start, min(total_frames, start + segment_frames)) for start in range(0, total_frames, segment_frames)]
+
+
+def _run_ffmpeg(ffmpeg: str, args: List[str]):
+    subprocess.run([ffmpeg, '-y', '-loglevel', 'error'] + args, check=True)
+
+
+def concat_segments(segment_paths: List[str], output_path: str, fps: float, size: Tuple[int, int], audio_source: Optional[str] = None):
+    ffmpeg = find_ffmpeg()
+    if not ffmpeg:
+        # 没有 ffmpeg 时退化为逐帧重写，且无法附带音轨
+        if len(segment_paths) == 1:
+            # 分段可能来自增量缓存，只能复制不能移走
+            shutil.copyfile(segment_paths[0], output_path)
+            return
+        
+        out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+        try:
+            for path in segment_paths:
+                cap = cv2.VideoCapture(path)
+                while True:
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    out.write(frame)
+                cap.release()
+        finally:
+            out.release()
+        return
+    
+    list_path = output_path + '.segments.txt'
+    with open(list_path, 'w', encoding='utf-8') as f:
+        for path in segment_paths:
+            f.write(f"file '{os.path.abspath(path)}'\n")
+    
+    # 视频段直接拷贝拼接，原视频音轨不转码直接封装
+    inputs = ['-f', 'concat', '-safe', '0', '-i', list_path]
+    maps = ['-map', '0:v:0']
+    if audio_source:
+        inputs += ['-i', audio_source]
+        maps += ['-map', '1:a:0?']
+    
+    try:
+        try:
+            _run_ffmpeg(ffmpeg, inputs + maps + ['-c', 'copy', '-movflags', '+faststart', output_path])
+        except subprocess.CalledProcessError:
+            if not audio_source:
+                raise
+            # 音频编码无法放入 MP4（如 PCM、Vorbis）时才转为 AAC
+            _run_ffmpeg(ffmpeg, inputs + maps + ['-c:v', 'copy', '-c:a', 'aac', '-movflags', '+faststart', output_path])
+    finally:
+        os.remove(list_path)
+
+
+def merge_stage_stats(total: Dict[str, StageStats], stats: Dict[str, StageStats]):
+    for name, stage in stats.items():
+        if name not in total:
+            total[name] = StageStats(name)
+        total[name].merge(stage)
+
+
+# 增量渲染缓存的分段长度固定，不随进程数变化，保证同一段时间轴每次都落在同一个缓存键上
+CACHE_SEGMENT_SECONDS = 4.0
+SEGMENT_CACHE_VERSION = 1
+
+# 影响输出画面的源码，改动后缓存的分段与批量渲染结果都视为过期
+RENDER_SOURCES = ('engine.py', 'events.py', 'renderer.py', 'processor.py', 'fonts.py', 'frame_store.py')
+
+
+def render_source_hash() -> str:
+    digest = hashlib.sha256()
+    core_dir = os.path.dirname(os.path.abspath(__file__))
+    for name in RENDER_SOURCES:
+        with open(os.path.join(core_dir, name), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def segment_cache_dir(output_dir: str, video_name: str) -> str:
+    return os.path.join(output_dir, ".segments", video_name)
+
+
+def cache_segments(total_frames: int, fps: float) -> List[Tuple[int, int]]:
+    segment_frames = max(1, int(round(fps * CACHE_SEGMENT_SECONDS)))
+    return [(start, min(total_frames, start + segment_frames)) for start in range(0, total_frames, segment_frames)]
+
+
+def segment_cache_key(video_path: str, start: int, states: np.ndarray, renderer: SF6Renderer, p1_id: str, p2_id: str,
+                      fps: float, code_hash: str) -> str:
+    # 键覆盖分段的 HUD 状态、源视频、渲染参数、编码方式和渲染源码，任何一项变化都会重新渲染该段
+    stat = os.stat(video_path)
+    digest = hashlib.sha256()
+    digest.update(json.dumps([
+        SEGMENT_CACHE_VERSION, os.path.abspath(video_path), stat.st_size, stat.st_mtime, start, len(states), fps,
+        renderer.width, renderer.height, renderer.scale, renderer.font_name, renderer.font_size,
+        p1_id, p2_id, bool(find_ffmpeg()), code_hash
+    ]).encode())
+    digest.update(np.ascontiguousarray(states).tobytes())
+    return digest.hexdigest()[:32]
+
+
+def render_video(video_path: str, engine: FightStateEngine, renderer: SF6Renderer, output_path: str,
+                 p1_id: str = "P1", p2_id: str = "P2", workers: Optional[int] = None,
+                 progress_callback: Optional[Callable[[float], None]] = None, with_audio: bool = True,
+                 stats_callback: Optional[Callable[[Dict[str, StageStats]], None]] = None,
+                 cache_dir: Optional[str] = None, use_frame_store: bool = True, index: Optional[VideoIndex] = None) -> str:
+    if index is None:
+        (total_frames, fps, width, height), index = probe_indexed(video_path)
+    else:
+        total_frames = index.frame_count
+        _, fps, width, height = probe_video(video_path)
+    if total_frames <= 0:
+        raise ValueError(f"无法读取视频帧数: {video_path}")
+    if renderer.width != width or renderer.height != height:
+        raise ValueError(f"渲染器分辨率 {renderer.width}x{renderer.height} 与视频 {width}x{height} 不一致")
+    
+    states = build_hud_states(engine.compute_timeline(total_frames, fps))
+    workers = max(1, workers or os.cpu_count() or 1)
+    
+    # 原分辨率的帧存储覆盖全部帧时才使用，与直接解码的帧逐像素一致，分段缓存键不受影响
+    store = open_frame_store(video_path) if use_frame_store else None
+    store_path = store.path if store is not None and (store.width, store.height) == (width, height) and len(store) >= total_frames else None
+    
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(output_dir, exist_ok=True)
+    temp_dir = tempfile.mkdtemp(prefix='segments_', dir=output_dir)
+    
+    if cache_dir:
+        # 增量模式：分段按 HUD 状态哈希存入缓存目录，状态未变的分段直接复用已编码的文件
+        os.makedirs(cache_dir, exist_ok=True)
+        segments = cache_segments(total_frames, fps)
+        code_hash = render_source_hash()
+        segment_paths = [
+            os.path.join(cache_dir, segment_cache_key(video_path, start, states[start:stop], renderer, p1_id, p2_id, fps, code_hash) + '.mp4')
+            for start, stop in segments
+        ]
+    else:
+        segments = split_segments(total_frames, workers, fps)
+        segment_paths = [os.path.join(temp_dir, f"{i:05d}.mp4") for i in range(len(segments))]
+    
+    # 待渲染的分段先写到临时目录，完成后再移动到最终位置，中断时缓存里不会留下半成品
+    tasks = [
+        (start, stop, os.path.join(temp_dir, f"part_{i:05d}.mp4"), path)
+        for i, ((start, stop), path) in enumerate(zip(segments, segment_paths))
+        if not os.path.exists(path)
+    ]
+    
+    stage_stats: Dict[str, StageStats] = {}
+    try:
+        done = total_frames - sum(stop - start for start, stop, _, _ in tasks)
+        if progress_callback and done:
+            progress_callback(done / total_frames)
+        
+        if workers == 1 or len(tasks) <= 1:
+            for start, stop, part_path, path in tasks:
+                _, frames, stats = render_segment(video_path, part_path, start, states[start:stop], renderer, p1_id, p2_id, fps,
+                                                  frame_store=store_path, index=index)
+                os.replace(part_path, path)
+                merge_stage_stats(stage_stats, stats)
+                done += frames
+                if progress_callback:
+                    progress_callback(done / total_frames)
+        else:
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), mp_context=context) as pool:
+                futures = {
+                    pool.submit(render_segment, video_path, part_path, start, states[start:stop], renderer, p1_id, p2_id, fps,
+                                frame_store=store_path, index=index): path
+                    for start, stop, part_path, path in tasks
+                }
+                try:
+                    for future in as_completed(futures):
+                        part_path, frames, stats = future.result()
+                        os.replace(part_path, futures[future])
+                        merge_stage_stats(stage_stats, stats)
+                        done += frames
+                        if progress_callback:
+                            progress_callback(done / total_frames)
+                except BaseException:
+                    # 出错或被取消时丢弃尚未开始的分段，不再等待它们渲染完
+                    for future in futures:
+                        future.cancel()
+                    raise
+        
+        concat_segments(segment_paths, output_path, fps, (width, height), video_path if with_audio else None)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    if cache_dir:
+        # 只保留本次用到的分段，缓存大小不超过一份输出视频
+        keep = {os.path.basename(path) for path in segment_paths}
+        for name in os.listdir(cache_dir):
+            if name.endswith('.mp4') and name not in keep:
+                os.remove(os.path.join(cache_dir, name))
+    
+    if stats_callback:
+        stats_callback(stage_stats)
+    return output_path
+
+
+def hud_region(renderer: SF6Renderer, states: np.ndarray, p1_id: str, p2_id: str) -> Optional[Tuple[int, int, int, int]]:
+    # 所有帧共用的 HUD 区域：血条等部件都落在背景槽内，只需取最左、最右两个抖动位置的并集
+    boxes = []
+    for shake_x in {int(states[:, 6].min()), int(states[:, 6].max())}:
+        hud = renderer.render_hud(p1_id, p2_id, (shake_x, 0))
+        if hud is not None:
+            image, (x, y) = hud
+            boxes.append((x, y, x + image.width, y + image.height))
+    if not boxes:
+        return None
+    return min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes)
+
+
+def render_overlay(video_info: Tuple[int, float, int, int], engine: FightStateEngine, renderer: SF6Renderer, output_path: str,
+                   p1_id: str = "P1", p2_id: str = "P2", fmt: str = 'png',
+                   progress_callback: Optional[Callable[[float], None]] = None) -> Dict:
+    # 只输出裁剪后的 HUD 条（带 alpha）和偏移清单，完全不解码原视频
+    if fmt not in OVERLAY_FORMATS:
+        raise ValueError(f"不支持的 HUD 输出格式: {fmt}")
+    
+    total_frames, fps, width, height = video_info
+    if renderer.width != width or renderer.height != height:
+        raise ValueError(f"渲染器分辨率 {renderer.width}x{renderer.height} 与视频 {width}x{height} 不一致")
+    
+    states = build_hud_states(engine.compute_timeline(total_frames, fps))
+    region = hud_region(renderer, states, p1_id, p2_id) if total_frames > 0 else None
+    if region is None:
+        raise ValueError("HUD 区域为空")
+    
+    left, top, right, bottom = region
+    size = (right - left, bottom - top)
+    
+    writer = None
+    if fmt == 'png':
+        os.makedirs(output_path, exist_ok=True)
+        manifest_path = os.path.join(output_path, 'manifest.json')
+    else:
+        manifest_path = os.path.splitext(output_path)[0] + '.json'
+        if fmt == 'prores':
+            ffmpeg = find_ffmpeg()
+            if not ffmpeg:
+                raise RuntimeError("ProRes 4444 输出需要 ffmpeg")
+            writer = FFmpegWriter(output_path, fps, size, ffmpeg, pix_fmt='rgba',
+                                  codec_args=['-c:v', 'prores_ks', '-profile:v', '4444', '-pix_fmt', 'yuva444p10le'])
+        else:
+            writer = open(output_path, 'wb')
+    
+    try:
+        for frame_idx, state in enumerate(states):
+            shake_offset = apply_hud_state(renderer, state)
+            canvas = Image.new('RGBA', size, (0, 0, 0, 0))
+            hud = renderer.render_hud(p1_id, p2_id, shake_offset)
+            if hud is not None:
+                image, (x, y) = hud
+                canvas.paste(image, (x - left, y - top))
+            
+            if writer is None:
+                canvas.save(os.path.join(output_path, f"hud_{frame_idx:06d}.png"), compress_level=1)
+            else:
+                writer.write(np.asarray(canvas))
+            
+            if progress_callback and frame_idx % 30 == 0:
+                progress_callback(frame_idx / total_frames)
+    finally:
+        if isinstance(writer, FFmpegWriter):
+            writer.release()
+        elif writer is not None:
+            writer.close()
+    
+    manifest = {
+        'format': fmt,
+        'output': os.path.basename(os.path.normpath(output_path)),
+        'pattern': 'hud_%06d.png' if fmt == 'png' else None,
+        'pixel_format': 'rgba' if fmt != 'prores' else 'yuva444p10le',
+        'fps': fps,
+        'frame_count': total_frames,
+        'source_size': [width, height],
+        'region': {'x': left, 'y': top, 'width': size[0], 'height': size[1]},
+        'p1_id': p1_id,
+        'p2_id': p2_id
+    }
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    
+    if progress_callback:
+        progress_callback(1.0)
+    return manifest
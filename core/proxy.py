@@ -0,0 +1,151 @@
+import os
+import subprocess
+from typing import Callable, Optional
+
+import cv2
+
+from core.frame_cache import resize_to_width
+from core.ffmpeg_utils import find_ffmpeg
+from core.processor import FFmpegWriter, probe_video
+
+
+PROXY_DIR = "output/proxy"
+
+# 全 I 帧编码：任意帧随机访问都只需解码一帧
+PROXY_CODEC_ARGS = ['-c:v', 'libx264', '-preset', 'ultrafast', '-tune', 'fastdecode', '-g', '1', '-crf', '23', '-pix_fmt', 'yuv420p']
+
+# 浏览器端播放用：普通 GOP、保留音轨、moov 前置，文件小且可以边下边播
+PLAYBACK_WIDTH = 960
+PLAYBACK_CODEC_ARGS = ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '26', '-pix_fmt', 'yuv420p',
+                       '-c:a', 'aac', '-b:a', '96k', '-movflags', '+faststart']
+
+
+def proxy_width(width: int) -> int:
+    # yuv420p 要求偶数宽度；代理文件名、预览缓存键和解码尺寸都使用取整后的宽度
+    return max(2, width - width % 2)
+
+
+def proxy_path(video_path: str, width: int, proxy_dir: str = PROXY_DIR, ext: str = '.mp4') -> str:
+    video_name = os.path.splitext(os.path.basename(video_path))[0]
+    return os.path.join(proxy_dir, f"{video_name}_{width}w{ext}")
+
+
+def find_proxy(video_path: str, width: int, proxy_dir: str = PROXY_DIR) -> Optional[str]:
+    # 只返回比源视频新的代理文件，源视频被替换后旧代理自动失效
+    try:
+        source_mtime = os.path.getmtime(video_path)
+    except OSError:
+        return None
+    for ext in ('.mp4', '.avi'):
+        path = proxy_path(video_path, width, proxy_dir, ext)
+        if os.path.exists(path) and os.path.getmtime(path) >= source_mtime:
+            return path
+    return None
+
+
+def build_proxy(video_path: str, width: int, proxy_dir: str = PROXY_DIR,
+                progress_callback: Optional[Callable[[float], None]] = None) -> str:
+    total_frames, fps, _, _ = probe_video(video_path)
+    ffmpeg = find_ffmpeg()
+    width = proxy_width(width)
+    
+    # 逐帧用 OpenCV 解码后写入，代理文件的帧号与源视频的 cv2 帧号严格对应
+    output_path = proxy_path(video_path, width, proxy_dir, '.mp4' if ffmpeg else '.avi')
+    temp_path = output_path + '.part' + os.path.splitext(output_path)[1]
+    os.makedirs(proxy_dir, exist_ok=True)
+    
+    cap = cv2.VideoCapture(video_path)
+    writer = None
+    written = 0
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            
+            frame = resize_to_width(frame, width)
+            if writer is None:
+                size = (frame.shape[1], frame.shape[0])
+                if ffmpeg:
+                    # yuv420p 要求偶数尺寸，宽度已取整
+                    size = (size[0], size[1] - size[1] % 2)
+                    writer = FFmpegWriter(temp_path, fps, size, ffmpeg, codec_args=PROXY_CODEC_ARGS)
+                else:
+                    writer = cv2.VideoWriter(temp_path, cv2.VideoWriter_fourcc(*'MJPG'), fps, size)
+            
+            writer.write(frame[:size[1], :size[0]])
+            written += 1
+            if progress_callback and total_frames > 0 and written % 30 == 0:
+                progress_callback(min(1.0, written / total_frames))
+    except BaseException:
+        if writer is not None:
+            try:
+                writer.release()
+            except RuntimeError:
+                pass
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    finally:
+        cap.release()
+    
+    if writer is None:
+        raise RuntimeError(f"无法读取视频: {video_path}")
+    writer.release()
+    os.replace(temp_path, output_path)
+    
+    if progress_callback:
+        progress_callback(1.0)
+    return output_path
+
+
+def playback_path(video_path: str, width: int = PLAYBACK_WIDTH, proxy_dir: str = PROXY_DIR) -> str:
+    video_name = os.path.splitext(os.path.basename(video_path))[0]
+    return os.path.join(proxy_dir, f"{video_name}_{width}w_play.mp4")
+
+
+def find_playback_proxy(video_path: str, width: int = PLAYBACK_WIDTH, proxy_dir: str = PROXY_DIR) -> Optional[str]:
+    path = playback_path(video_path, width, proxy_dir)
+    try:
+        if os.path.getmtime(path) >= os.path.getmtime(video_path):
+            return path
+    except OSError:
+        pass
+    return None
+
+
+def build_playback_proxy(video_path: str, width: int = PLAYBACK_WIDTH, proxy_dir: str = PROXY_DIR,
+                         progress_callback: Optional[Callable[[float], None]] = None) -> str:
+    ffmpeg = find_ffmpeg()
+    if not ffmpeg:
+        raise RuntimeError("生成播放文件需要 ffmpeg")
+    total_frames, _, source_width, _ = probe_video(video_path)
+    
+    output_path = playback_path(video_path, width, proxy_dir)
+    temp_path = output_path + '.part.mp4'
+    os.makedirs(proxy_dir, exist_ok=True)
+    
+    # passthrough 保持源视频的帧时间戳，浏览器按时间换算出的帧号与 cv2 帧号一致
+    process = subprocess.Popen(
+        [ffmpeg, '-y', '-v', 'error', '-i', video_path, '-map', '0:v:0', '-map', '0:a:0?',
+         '-vf', f"scale={min(width, source_width)}:-2", '-fps_mode', 'passthrough'] + PLAYBACK_CODEC_ARGS +
+        ['-progress', 'pipe:1', '-nostats', temp_path],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+    )
+    try:
+        for line in process.stdout:
+            if progress_callback and line.startswith('frame=') and total_frames > 0:
+                progress_callback(min(0.99, int(line[6:]) / total_frames))
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg 编码失败，退出码 {process.returncode}")
+    except BaseException:
+        process.kill()
+        process.wait()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    os.replace(temp_path, output_path)
+    
+    if progress_callback:
+        progress_callback(1.0)
+    return output_path
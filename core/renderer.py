@@ -1,13 +1,19 @@
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
+import cv2
 import numpy as np
-from typing import Tuple, Optional
+from collections import OrderedDict
+from typing import List, Tuple, Optional
+
+from core.fonts import FontRegistry, get_font_registry
 
 
 class SF6Renderer:
     
-    def __init__(self, width: int = 1920, height: int = 1080):
+    def __init__(self, width: int = 1920, height: int = 1080, font_registry: Optional[FontRegistry] = None, scale: float = 1.0):
         self.width = width
         self.height = height
+        # 版面尺寸按 1080p 设计，代理预览等小画布按比例缩放
+        self.scale = scale
         
         self.p1_hp_target = 100.0
         self.p1_hp_display = 100.0
@@ -17,14 +23,19 @@ class SF6Renderer:
         self.p1_drive = 6
         self.p2_drive = 6
         
-        self.bar_width = 600
-        self.bar_height = 25
-        self.bar_skew = 20
+        self.bar_width = self._scaled(600)
+        self.bar_height = self._scaled(25)
+        self.bar_skew = self._scaled(20)
+        
+        self.block_height = self._scaled(12)
+        self.block_gap = self._scaled(4)
+        self.gauge_gap = self._scaled(8)
+        self.info_gap = self._scaled(28)
         
-        self.p1_x = 50
-        self.p2_x = width - 50 - self.bar_width
+        self.p1_x = self._scaled(50)
+        self.p2_x = width - self._scaled(50) - self.bar_width
         
-        self.y_pos = 60
+        self.y_pos = self._scaled(60)
         
         self.colors = {
             'bg': (40, 40, 40, 51),
@@ -34,6 +45,49 @@ class SF6Renderer:
             'drive_empty': (80, 80, 80, 255),
             'text': (255, 255, 255, 255)
         }
+        self.outline_color = (255, 255, 255, 128)
+        
+        self.fonts = font_registry or get_font_registry()
+        self.font_name = "Arial.ttf"
+        self.font_size = self._scaled(24)
+        
+        # 预光栅化的血条/驱动格 sprite，键为 (类型, 宽, 高, 倾斜, 填充色, 描边色)
+        self.sprite_cache_size = 256
+        self._sprite_cache: OrderedDict = OrderedDict()
+        
+        # 背景槽、空驱动格和角色名组成的静态层，按分辨率与角色名缓存
+        self._static_key = None
+        self._static_layer = None
+        
+        # render_bgr 使用的 BGRA 数组版 sprite/静态层，以及按需增长、逐帧复用的 HUD 与混合缓冲区
+        self._array_cache: OrderedDict = OrderedDict()
+        self._static_arrays_key = None
+        self._static_arrays = None
+        self._buffers: dict = {}
+        
+        # 按可见状态（各条像素宽度、驱动格数、抖动偏移、角色名）记忆整条 HUD，相邻的相同帧直接复用
+        # render_hud 记忆 PIL 图像，render_bgr 记忆预乘好的混合输入
+        self.hud_memo_size = 16
+        self._hud_memo: OrderedDict = OrderedDict()
+        self._blend_memo: OrderedDict = OrderedDict()
+        self.hud_memo_hits = 0
+        self.hud_memo_misses = 0
+    
+    def _scaled(self, value: int) -> int:
+        return max(1, round(value * self.scale))
+    
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state['_sprite_cache'] = OrderedDict()
+        state['_static_key'] = None
+        state['_static_layer'] = None
+        state['_array_cache'] = OrderedDict()
+        state['_static_arrays_key'] = None
+        state['_static_arrays'] = None
+        state['_buffers'] = {}
+        state['_hud_memo'] = OrderedDict()
+        state['_blend_memo'] = OrderedDict()
+        return state
     
     def set_hp(self, player: int, target: float, display: Optional[float] = None):
         if player == 1:
@@ -63,70 +117,167 @@ class SF6Renderer:
         coords = self._skewed_rect_coords(x, y, w, h, skew)
         draw.polygon(coords, fill=fill, outline=outline)
     
-    def _draw_health_bar(self, draw: ImageDraw.ImageDraw, x: int, display_hp: float, target_hp: float, is_left: bool = True):
+    def _health_bar_pieces(self, x: int, display_hp: float, target_hp: float, is_left: bool = True) -> List[tuple]:
         skew = -self.bar_skew if is_left else self.bar_skew
-        
-        outline_color = (255, 255, 255, 128)
-        
-        self._draw_skewed_rect(draw, x, self.y_pos, self.bar_width, self.bar_height, skew, self.colors['bg'], outline=outline_color)
+        pieces = []
         
         damage_width = max(0, int(self.bar_width * (display_hp - target_hp) / 100))
         if damage_width > 0:
             bar_x = x if is_left else x + self.bar_width - damage_width
-            self._draw_skewed_rect(draw, bar_x, self.y_pos, damage_width, self.bar_height, skew, self.colors['damage'], outline=outline_color)
+            pieces.append(('damage', bar_x, self.y_pos, damage_width, self.bar_height, skew, self.colors['damage'], self.outline_color))
         
         health_width = max(0, int(self.bar_width * target_hp / 100))
         if health_width > 0:
             bar_x = x if is_left else x + self.bar_width - health_width
-            self._draw_skewed_rect(draw, bar_x, self.y_pos, health_width, self.bar_height, skew, self.colors['health'], outline=outline_color)
+            pieces.append(('health', bar_x, self.y_pos, health_width, self.bar_height, skew, self.colors['health'], self.outline_color))
+        
+        return pieces
     
-    def _draw_drive_gauge(self, draw: ImageDraw.ImageDraw, x: int, drive: int, is_left: bool = True):
+    def _drive_gauge_pieces(self, x: int, drive: int, is_left: bool = True) -> List[tuple]:
         block_width = self.bar_width // 6
-        block_height = 12
-        gauge_y = self.y_pos + self.bar_height + 8
+        block_height = self.block_height
+        gauge_y = self.y_pos + self.bar_height + self.gauge_gap
+        skew = -self.bar_skew if is_left else self.bar_skew
+        pieces = []
         
         for i in range(6):
             block_x = x + i * block_width if is_left else x + (5 - i) * block_width
-            skew = -self.bar_skew if is_left else self.bar_skew
-            
-            color = self.colors['drive'] if i < drive else self.colors['drive_empty']
-            self._draw_skewed_rect(draw, block_x, gauge_y, block_width - 4, block_height, skew, color)
+            kind = 'drive' if i < drive else 'drive_empty'
+            pieces.append((kind, block_x, gauge_y, block_width - self.block_gap, block_height, skew, self.colors[kind], None))
+        
+        return pieces
     
-    def _draw_player_info(self, draw: ImageDraw.ImageDraw, x: int, player_id: str, is_left: bool = True):
-        info_y = self.y_pos + self.bar_height + 28
+    def _draw_health_bar(self, draw: ImageDraw.ImageDraw, x: int, display_hp: float, target_hp: float, is_left: bool = True):
+        skew = -self.bar_skew if is_left else self.bar_skew
         
-        try:
-            font = ImageFont.truetype("Arial.ttf", 24)
-        except:
-            font = ImageFont.load_default()
+        self._draw_skewed_rect(draw, x, self.y_pos, self.bar_width, self.bar_height, skew, self.colors['bg'], outline=self.outline_color)
         
+        for _, bar_x, y, w, h, skew, fill, outline in self._health_bar_pieces(x, display_hp, target_hp, is_left):
+            self._draw_skewed_rect(draw, bar_x, y, w, h, skew, fill, outline=outline)
+    
+    def _draw_drive_gauge(self, draw: ImageDraw.ImageDraw, x: int, drive: int, is_left: bool = True):
+        for _, block_x, y, w, h, skew, fill, outline in self._drive_gauge_pieces(x, drive, is_left):
+            self._draw_skewed_rect(draw, block_x, y, w, h, skew, fill, outline=outline)
+    
+    def _player_info_position(self, x: int, player_id: str, is_left: bool = True) -> Tuple[int, int]:
+        info_y = self.y_pos + self.bar_height + self.info_gap
         text_x = x if is_left else x + self.bar_width
         
-        try:
-            if is_left:
-                draw.text((text_x, info_y), player_id, fill=self.colors['text'], font=font)
-            else:
-                bbox = draw.textbbox((0, 0), player_id, font=font)
-                text_width = bbox[2] - bbox[0]
-                draw.text((text_x - text_width, info_y), player_id, fill=self.colors['text'], font=font)
-        except:
-            if is_left:
-                draw.text((text_x, info_y), player_id, fill=self.colors['text'])
-            else:
-                bbox = draw.textbbox((0, 0), player_id)
-                text_width = bbox[2] - bbox[0]
-                draw.text((text_x - text_width, info_y), player_id, fill=self.colors['text'])
+        if not is_left:
+            bbox = self.fonts.text_bbox(player_id, self.font_name, self.font_size)
+            text_x -= bbox[2] - bbox[0]
+        
+        return text_x, info_y
     
-    def render(self, frame: Optional[Image.Image] = None, p1_id: str = "P1", p2_id: str = "P2", shake_offset: Tuple[int, int] = (0, 0)) -> Image.Image:
-        if frame is None:
-            frame = Image.new('RGBA', (self.width, self.height), (0, 0, 0, 0))
-        elif frame.mode != 'RGBA':
-            frame = frame.convert('RGBA')
+    def _draw_player_info(self, draw: ImageDraw.ImageDraw, x: int, player_id: str, is_left: bool = True):
+        font = self.fonts.get(self.font_name, self.font_size)
+        draw.text(self._player_info_position(x, player_id, is_left), player_id, fill=self.colors['text'], font=font)
+    
+    def _paste_player_info(self, image: Image.Image, x: int, player_id: str, is_left: bool = True):
+        bitmap = self.fonts.text_bitmap(player_id, self.font_name, self.font_size, self.colors['text'])
+        if bitmap is None:
+            return
         
-        overlay = Image.new('RGBA', (self.width, self.height), (0, 0, 0, 0))
-        draw = ImageDraw.Draw(overlay, 'RGBA')
+        text_image, (dx, dy) = bitmap
+        text_x, text_y = self._player_info_position(x, player_id, is_left)
+        image.paste(text_image, (text_x + dx, text_y + dy))
+    
+    def _get_sprite(self, kind: str, w: int, h: int, skew: int, fill: Tuple[int, ...], outline: Optional[Tuple[int, ...]]) -> Tuple[Image.Image, Image.Image, int]:
+        key = (kind, w, h, skew, fill, outline)
+        sprite = self._sprite_cache.get(key)
+        if sprite is not None:
+            self._sprite_cache.move_to_end(key)
+            return sprite
+        
+        left = min(0, skew)
+        image = Image.new('RGBA', (w + abs(skew) + 2, h + 2), (0, 0, 0, 0))
+        self._draw_skewed_rect(ImageDraw.Draw(image, 'RGBA'), -left, 0, w, h, skew, fill, outline=outline)
+        # RGBA 上的 ImageDraw 是覆盖写入，用二值 mask 粘贴即可逐像素复现
+        mask = image.getchannel('A').point(lambda a: 255 if a else 0)
+        
+        sprite = (image, mask, left)
+        self._sprite_cache[key] = sprite
+        if len(self._sprite_cache) > self.sprite_cache_size:
+            self._sprite_cache.popitem(last=False)
+        return sprite
+    
+    def _build_static_layer(self, p1_id: str, p2_id: str) -> Optional[Tuple[Image.Image, Tuple[int, int]]]:
+        # 抖动只作用于水平方向，左右留白保证被画布边缘裁掉的部分在抖动后仍然正确
+        pad = 32
+        size = (self.width + 2 * pad, self.height)
+        
+        def layer(draw_fn) -> Image.Image:
+            image = Image.new('RGBA', size, (0, 0, 0, 0))
+            draw_fn(image)
+            return image
+        
+        def bars(x: int, is_left: bool):
+            def draw_fn(image):
+                draw = ImageDraw.Draw(image, 'RGBA')
+                self._draw_health_bar(draw, x, 0.0, 0.0, is_left)
+                self._draw_drive_gauge(draw, x, 0, is_left)
+            return draw_fn
         
-        shake_x, shake_y = shake_offset
+        p1_bars = layer(bars(self.p1_x + pad, True))
+        p2_bars = layer(bars(self.p2_x + pad, False))
+        p1_text = layer(lambda image: self._paste_player_info(image, self.p1_x + pad, p1_id, True))
+        p2_text = layer(lambda image: self._paste_player_info(image, self.p2_x + pad, p2_id, False))
+        
+        # 只有各部件互不重叠时，先铺静态层再叠动态部件才与原始绘制顺序等价
+        alphas = [np.asarray(im.getchannel('A')) > 0 for im in (p1_bars, p2_bars, p1_text, p2_text)]
+        for i in range(len(alphas)):
+            for j in range(i + 1, len(alphas)):
+                if np.any(alphas[i] & alphas[j]):
+                    return None
+        
+        static = p1_bars
+        for image, alpha in zip((p2_bars, p1_text, p2_text), alphas[1:]):
+            static.paste(image, (0, 0), Image.fromarray(alpha.astype(np.uint8) * 255))
+        
+        bbox = static.getbbox()
+        if bbox is None:
+            return None
+        return static.crop(bbox), (bbox[0] - pad, bbox[1])
+    
+    def _get_static_layer(self, p1_id: str, p2_id: str) -> Optional[Tuple[Image.Image, Tuple[int, int]]]:
+        key = (self.width, self.height, p1_id, p2_id)
+        if self._static_key != key:
+            self._static_layer = self._build_static_layer(p1_id, p2_id)
+            self._static_key = key
+        return self._static_layer
+    
+    def _dynamic_pieces(self, shake_x: int) -> List[tuple]:
+        pieces = []
+        pieces += self._health_bar_pieces(self.p1_x + shake_x, self.p1_hp_display, self.p1_hp_target, is_left=True)
+        pieces += self._health_bar_pieces(self.p2_x + shake_x, self.p2_hp_display, self.p2_hp_target, is_left=False)
+        pieces += [p for p in self._drive_gauge_pieces(self.p1_x + shake_x, self.p1_drive, is_left=True) if p[0] == 'drive']
+        pieces += [p for p in self._drive_gauge_pieces(self.p2_x + shake_x, self.p2_drive, is_left=False) if p[0] == 'drive']
+        return pieces
+    
+    def _hud_key(self, p1_id: str, p2_id: str, shake_x: int) -> tuple:
+        # 动态部件已经量化成整数像素几何，相同的键画出的 HUD 逐像素相同
+        return (self.width, self.height, p1_id, p2_id, shake_x, tuple(self._dynamic_pieces(shake_x)))
+    
+    def _memo_get(self, memo: OrderedDict, key: tuple):
+        if key in memo:
+            memo.move_to_end(key)
+            self.hud_memo_hits += 1
+            return True, memo[key]
+        self.hud_memo_misses += 1
+        return False, None
+    
+    def _memo_evict(self, memo: OrderedDict):
+        # 为新条目腾出位置，返回被淘汰的条目，调用方可以复用其中的数组
+        if len(memo) >= self.hud_memo_size:
+            return memo.popitem(last=False)[1]
+        return None
+    
+    def _memo_put(self, memo: OrderedDict, key: tuple, value):
+        self._memo_evict(memo)
+        memo[key] = value
+    
+    def _draw_overlay(self, overlay: Image.Image, p1_id: str, p2_id: str, shake_x: int):
+        draw = ImageDraw.Draw(overlay, 'RGBA')
         
         self._draw_health_bar(draw, self.p1_x + shake_x, self.p1_hp_display, self.p1_hp_target, is_left=True)
         self._draw_health_bar(draw, self.p2_x + shake_x, self.p2_hp_display, self.p2_hp_target, is_left=False)
@@ -136,8 +287,197 @@ class SF6Renderer:
         
         self._draw_player_info(draw, self.p1_x + shake_x, p1_id, is_left=True)
         self._draw_player_info(draw, self.p2_x + shake_x, p2_id, is_left=False)
+    
+    def render_hud(self, p1_id: str = "P1", p2_id: str = "P2", shake_offset: Tuple[int, int] = (0, 0)) -> Optional[Tuple[Image.Image, Tuple[int, int]]]:
+        # 抖动偏移以原始分辨率像素为单位
+        shake_x = round(shake_offset[0] * self.scale) if self.scale != 1.0 else shake_offset[0]
+        
+        # 返回的图像可能被后续帧复用，调用方只能读取不能修改
+        key = self._hud_key(p1_id, p2_id, shake_x)
+        found, hud = self._memo_get(self._hud_memo, key)
+        if not found:
+            hud = self._draw_hud(p1_id, p2_id, shake_x)
+            self._memo_put(self._hud_memo, key, hud)
+        return hud
+    
+    def _draw_hud(self, p1_id: str, p2_id: str, shake_x: int) -> Optional[Tuple[Image.Image, Tuple[int, int]]]:
+        static_layer = self._get_static_layer(p1_id, p2_id)
+        if static_layer is None:
+            overlay = Image.new('RGBA', (self.width, self.height), (0, 0, 0, 0))
+            self._draw_overlay(overlay, p1_id, p2_id, shake_x)
+            bbox = overlay.getbbox()
+            if bbox is None:
+                return None
+            return overlay.crop(bbox), (bbox[0], bbox[1])
+        
+        static_image, (static_x, static_y) = static_layer
+        layers = [(static_image, None, static_x + shake_x, static_y)]
+        for kind, x, y, w, h, skew, fill, outline in self._dynamic_pieces(shake_x):
+            image, mask, left = self._get_sprite(kind, w, h, skew, fill, outline)
+            layers.append((image, mask, x + left, y))
+        
+        # 所有绘制内容的外接矩形，裁剪到画面范围内
+        left = max(0, min(x for _, _, x, _ in layers))
+        top = max(0, min(y for _, _, _, y in layers))
+        right = min(self.width, max(x + image.width for image, _, x, _ in layers))
+        bottom = min(self.height, max(y + image.height for image, _, _, y in layers))
+        if right <= left or bottom <= top:
+            return None
+        
+        hud = Image.new('RGBA', (right - left, bottom - top), (0, 0, 0, 0))
+        for image, mask, x, y in layers:
+            hud.paste(image, (x - left, y - top), mask)
+        
+        return hud, (left, top)
+    
+    def render(self, frame: Optional[Image.Image] = None, p1_id: str = "P1", p2_id: str = "P2", shake_offset: Tuple[int, int] = (0, 0)) -> Image.Image:
+        if frame is None:
+            frame = Image.new('RGBA', (self.width, self.height), (0, 0, 0, 0))
+        elif frame.mode != 'RGBA':
+            frame = frame.convert('RGBA')
+        
+        hud = self.render_hud(p1_id, p2_id, shake_offset)
+        if hud is not None:
+            hud_image, position = hud
+            frame.paste(hud_image, position, hud_image)
+        
+        return frame
+    
+    def composite_array(self, frame: np.ndarray, p1_id: str = "P1", p2_id: str = "P2", shake_offset: Tuple[int, int] = (0, 0), channel_order: str = 'RGB') -> np.ndarray:
+        # 直接把 HUD 混合进解码得到的 HxWx3 uint8 数组（原地修改），结果与 PIL paste 逐像素一致
+        hud = self.render_hud(p1_id, p2_id, shake_offset)
+        if hud is None:
+            return frame
+        
+        hud_image, (x, y) = hud
+        h = min(hud_image.height, frame.shape[0] - y)
+        w = min(hud_image.width, frame.shape[1] - x)
+        if h <= 0 or w <= 0:
+            return frame
+        
+        hud_array = np.asarray(hud_image)[:h, :w]
+        color = hud_array[..., 2::-1] if channel_order == 'BGR' else hud_array[..., :3]
+        alpha = hud_array[..., 3:4].astype(np.uint32)
+        
+        region = frame[y:y + h, x:x + w]
+        blended = region * (255 - alpha) + color * alpha + 128
+        region[...] = ((blended >> 8) + blended) >> 8
+        
+        return frame
+    
+    def _get_sprite_array(self, kind: str, w: int, h: int, skew: int, fill: Tuple[int, ...], outline: Optional[Tuple[int, ...]]) -> Tuple[np.ndarray, np.ndarray, int]:
+        key = (kind, w, h, skew, fill, outline)
+        sprite = self._array_cache.get(key)
+        if sprite is not None:
+            self._array_cache.move_to_end(key)
+            return sprite
+        
+        image, mask, left = self._get_sprite(kind, w, h, skew, fill, outline)
+        sprite = (np.ascontiguousarray(np.asarray(image)[..., [2, 1, 0, 3]]), np.array(mask), left)
+        self._array_cache[key] = sprite
+        if len(self._array_cache) > self.sprite_cache_size:
+            self._array_cache.popitem(last=False)
+        return sprite
+    
+    def _get_static_arrays(self, p1_id: str, p2_id: str) -> Optional[Tuple[np.ndarray, Tuple[int, int]]]:
+        key = (self.width, self.height, p1_id, p2_id)
+        if self._static_arrays_key != key:
+            static_layer = self._get_static_layer(p1_id, p2_id)
+            if static_layer is None:
+                self._static_arrays = None
+            else:
+                image, origin = static_layer
+                self._static_arrays = (np.ascontiguousarray(np.asarray(image)[..., [2, 1, 0, 3]]), origin)
+            self._static_arrays_key = key
+        return self._static_arrays
+    
+    def _buffer(self, name: str, shape: Tuple[int, int, int], dtype) -> np.ndarray:
+        # 按元素数取连续缓冲区的前缀再 reshape，只在 HUD 变大时重新分配
+        size = shape[0] * shape[1] * shape[2]
+        flat = self._buffers.get(name)
+        if flat is None or flat.size < size:
+            flat = np.empty(size, dtype=dtype)
+            self._buffers[name] = flat
+        return flat[:size].reshape(shape)
+    
+    def _build_blend(self, static: Tuple[np.ndarray, Tuple[int, int]], shake_x: int, frame_size: Tuple[int, int]) -> Optional[tuple]:
+        static_array, (static_x, static_y) = static
+        layers = [(static_array, None, static_x + shake_x, static_y)]
+        for kind, x, y, w, h, skew, fill, outline in self._dynamic_pieces(shake_x):
+            array, mask, left = self._get_sprite_array(kind, w, h, skew, fill, outline)
+            layers.append((array, mask, x + left, y))
+        
+        left = max(0, min(x for _, _, x, _ in layers))
+        top = max(0, min(y for _, _, _, y in layers))
+        right = min(frame_size[1], max(x + array.shape[1] for array, _, x, _ in layers))
+        bottom = min(frame_size[0], max(y + array.shape[0] for array, _, _, y in layers))
+        if right <= left or bottom <= top:
+            self._memo_evict(self._blend_memo)
+            return None
+        h, w = bottom - top, right - left
+        
+        hud = self._buffer('hud', (h, w, 4), np.uint8)
+        hud.fill(0)
+        for array, mask, x, y in layers:
+            x0, y0 = max(x, left), max(y, top)
+            x1, y1 = min(x + array.shape[1], right), min(y + array.shape[0], bottom)
+            if x1 <= x0 or y1 <= y0:
+                continue
+            target = hud[y0 - top:y1 - top, x0 - left:x1 - left]
+            source = array[y0 - y:y1 - y, x0 - x:x1 - x]
+            if mask is None:
+                # 静态层是第一层，透明像素本身就是全 0，直接整块拷贝
+                np.copyto(target, source)
+            else:
+                # cv2.copyTo 原地写入 ROI，比 np.copyto(where=...) 的广播掩码快两个数量级
+                cv2.copyTo(source, mask[y0 - y:y1 - y, x0 - x:x1 - x], target)
+        
+        # 预先算好 color * alpha + 128 与 255 - alpha，逐帧混合只剩与画面相关的部分
+        # 淘汰条目的数组尺寸相同时直接复用（抖动与血条变化通常不改变 HUD 外接矩形）
+        evicted = self._memo_evict(self._blend_memo)
+        if evicted is not None and evicted[2].shape == (h, w, 3):
+            premul, inverse = evicted[2], evicted[3]
+        else:
+            premul = np.empty((h, w, 3), dtype=np.uint16)
+            inverse = np.empty((h, w, 1), dtype=np.uint16)
+        
+        np.copyto(inverse, hud[..., 3:4])
+        np.multiply(hud[..., :3], inverse, out=premul)
+        np.add(premul, 128, out=premul)
+        np.subtract(255, inverse, out=inverse)
+        return left, top, premul, inverse
+    
+    def render_bgr(self, frame: np.ndarray, p1_id: str = "P1", p2_id: str = "P2", shake_offset: Tuple[int, int] = (0, 0)) -> np.ndarray:
+        # 导出热路径：直接在解码器输出的 BGR 数组上原地绘制，结果与 composite_array(channel_order='BGR') 逐像素一致
+        # 稳态下不分配整帧或 HUD 大小的临时数组
+        static = self._get_static_arrays(p1_id, p2_id)
+        if static is None:
+            return self.composite_array(frame, p1_id, p2_id, shake_offset, channel_order='BGR')
+        
+        shake_x = round(shake_offset[0] * self.scale) if self.scale != 1.0 else shake_offset[0]
+        
+        key = self._hud_key(p1_id, p2_id, shake_x) + (frame.shape[:2],)
+        found, blend = self._memo_get(self._blend_memo, key)
+        if not found:
+            blend = self._build_blend(static, shake_x, frame.shape[:2])
+            self._blend_memo[key] = blend
+        if blend is None:
+            return frame
+        
+        # 与 composite_array 相同的 DIV255 混合，全部写入预分配缓冲区
+        # 中间值最大 255 * 255 + 128 + 254，uint16 放得下，比 uint32 少一半内存带宽
+        left, top, premul, inverse = blend
+        h, w = inverse.shape[:2]
+        acc = self._buffer('acc', (h, w, 3), np.uint16)
+        tmp = self._buffer('tmp', (h, w, 3), np.uint16)
+        region = frame[top:top + h, left:left + w]
         
-        frame.paste(overlay, (0, 0), overlay)
+        np.multiply(region, inverse, out=acc)
+        np.add(acc, premul, out=acc)
+        np.right_shift(acc, 8, out=tmp)
+        np.add(acc, tmp, out=acc)
+        np.right_shift(acc, 8, out=acc)
+        np.copyto(region, acc, casting='unsafe')
         
         return frame
     
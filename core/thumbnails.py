@@ -0,0 +1,153 @@
+import os
+import subprocess
+from typing import Callable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from core.ffmpeg_utils import find_ffmpeg
+from core.processor import probe_video
+from core.video_index import load_index
+
+
+THUMB_DIR = "output/thumbs"
+THUMB_HEIGHT = 54
+# 缩略图下方事件标记条的高度
+MARKER_HEIGHT = 8
+
+
+def thumbnail_step(fps: float, interval: float = 0.5) -> int:
+    return max(1, int(round(fps * interval)))
+
+
+def thumbnails_path(video_path: str, step: int, thumb_dir: str = THUMB_DIR) -> str:
+    video_name = os.path.splitext(os.path.basename(video_path))[0]
+    return os.path.join(thumb_dir, f"{video_name}_{step}f.npy")
+
+
+def find_thumbnails(video_path: str, step: int, thumb_dir: str = THUMB_DIR) -> Optional[np.ndarray]:
+    # 只读内存映射，浏览时按需从磁盘取用到的几张，不占常驻内存；比源视频旧的缩略图视为失效
+    path = thumbnails_path(video_path, step, thumb_dir)
+    try:
+        if os.path.getmtime(path) < os.path.getmtime(video_path):
+            return None
+        return np.load(path, mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+
+
+def _thumb_size(width: int, height: int, thumb_height: int) -> Tuple[int, int]:
+    h = min(height, thumb_height)
+    w = max(2, round(width * h / height / 2) * 2)
+    return w, h - h % 2
+
+
+def _sampled_frames_ffmpeg(video_path: str, ffmpeg: str, step: int, size: Tuple[int, int]):
+    # select 按解码顺序的帧号取样，passthrough 保证取样后的帧不被补齐或丢弃
+    w, h = size
+    process = subprocess.Popen(
+        [ffmpeg, '-v', 'error', '-i', video_path, '-map', '0:v:0',
+         '-vf', f"select='not(mod(n\\,{step}))',scale={w}:{h}:flags=area,format=rgb24",
+         '-fps_mode', 'passthrough', '-f', 'rawvideo', '-'],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    frame_bytes = w * h * 3
+    try:
+        while True:
+            data = process.stdout.read(frame_bytes)
+            if len(data) < frame_bytes:
+                break
+            yield np.frombuffer(data, dtype=np.uint8).reshape(h, w, 3)
+    finally:
+        process.stdout.close()
+        process.kill()
+        process.wait()
+
+
+def _sampled_frames_cv2(video_path: str, step: int, size: Tuple[int, int]):
+    cap = cv2.VideoCapture(video_path)
+    try:
+        frame_idx = 0
+        while True:
+            if frame_idx % step:
+                if not cap.grab():
+                    break
+            else:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                yield cv2.cvtColor(cv2.resize(frame, size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2RGB)
+            frame_idx += 1
+    finally:
+        cap.release()
+
+
+def build_thumbnails(video_path: str, step: int, thumb_height: int = THUMB_HEIGHT, thumb_dir: str = THUMB_DIR,
+                     progress_callback: Optional[Callable[[float], None]] = None) -> str:
+    total_frames, _, width, height = probe_video(video_path)
+    # 容器头里的帧数可能不准，有关键帧索引时以索引为准
+    index = load_index(video_path, rebuild=False)
+    if index is not None and index.frame_count > 0:
+        total_frames = index.frame_count
+    count = max(1, -(-total_frames // step))
+    size = _thumb_size(width, height, thumb_height)
+    
+    output_path = thumbnails_path(video_path, step, thumb_dir)
+    temp_path = output_path[:-len('.npy')] + '.part.npy'
+    os.makedirs(thumb_dir, exist_ok=True)
+    
+    # 直接写入磁盘上的 .npy 内存映射，整段缩略图不需要一次放进内存
+    ffmpeg = find_ffmpeg()
+    frames = _sampled_frames_ffmpeg(video_path, ffmpeg, step, size) if ffmpeg else _sampled_frames_cv2(video_path, step, size)
+    thumbs = np.lib.format.open_memmap(temp_path, mode='w+', dtype=np.uint8, shape=(count, size[1], size[0], 3))
+    try:
+        for i, frame in enumerate(frames):
+            if i >= count:
+                break
+            thumbs[i] = frame
+            if progress_callback and i % 50 == 0:
+                progress_callback(min(1.0, (i + 1) / count))
+        thumbs.flush()
+    except BaseException:
+        del thumbs
+        frames.close()
+        os.remove(temp_path)
+        raise
+    frames.close()
+    del thumbs
+    os.replace(temp_path, output_path)
+    
+    if progress_callback:
+        progress_callback(1.0)
+    return output_path
+
+
+def compose_filmstrip(thumbs: np.ndarray, step: int, start_frame: int, end_frame: int, columns: int,
+                      markers: Optional[List[Tuple[int, Tuple[int, int, int]]]] = None,
+                      cursor: Optional[int] = None) -> np.ndarray:
+    # 把 [start_frame, end_frame) 均分成 columns 格，每格取中点所在的缩略图；
+    # 标记与光标按帧号线性映射到横坐标，与缩略图的位置一致
+    count, h, w, _ = thumbs.shape
+    span = max(1, end_frame - start_frame)
+    centers = start_frame + (np.arange(columns) + 0.5) * span / columns
+    indices = np.clip((centers // step).astype(np.int64), 0, count - 1)
+    
+    # 内存映射上的花式索引只读取用到的缩略图
+    tiles = np.asarray(thumbs[indices])
+    strip_width = columns * w
+    image = np.zeros((h + MARKER_HEIGHT, strip_width, 3), dtype=np.uint8)
+    image[:h] = tiles.transpose(1, 0, 2, 3).reshape(h, strip_width, 3)
+    image[h:] = 30
+    
+    def x_of(frame: int) -> int:
+        return int(np.clip((frame - start_frame) * strip_width / span, 0, strip_width - 1))
+    
+    for frame, color in markers or []:
+        if start_frame <= frame < end_frame:
+            x = x_of(frame)
+            image[h:, max(0, x - 1):x + 2] = color
+    
+    if cursor is not None and start_frame <= cursor < end_frame:
+        x = x_of(cursor)
+        image[:, max(0, x - 1):x + 1] = 255
+    return image
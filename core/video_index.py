@@ -0,0 +1,165 @@
+import bisect
+import json
+import os
+import subprocess
+from dataclasses import asdict, dataclass, field
+from fractions import Fraction
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from core.ffmpeg_utils import find_ffmpeg
+
+
+@dataclass
+class VideoIndex:
+    frame_count: int
+    fps: float
+    # 关键帧的帧号（按显示顺序），为空表示未知，只能退回 cap.set 定位
+    keyframes: List[int] = field(default_factory=list)
+    # 每帧相对第一帧的显示时间戳（秒），与 OpenCV 的 CAP_PROP_POS_MSEC 对应
+    timestamps: List[float] = field(default_factory=list)
+    source_size: int = 0
+    source_mtime: float = 0.0
+    
+    def keyframe_before(self, frame_idx: int) -> Optional[int]:
+        if not self.keyframes:
+            return None
+        pos = bisect.bisect_right(self.keyframes, frame_idx) - 1
+        return self.keyframes[max(0, pos)]
+    
+    def frame_at(self, timestamp: float) -> int:
+        # 取时间戳最接近的帧
+        pos = bisect.bisect_left(self.timestamps, timestamp)
+        if pos >= len(self.timestamps):
+            return len(self.timestamps) - 1
+        if pos > 0 and timestamp - self.timestamps[pos - 1] < self.timestamps[pos] - timestamp:
+            return pos - 1
+        return pos
+    
+    def matches(self, video_path: str) -> bool:
+        stat = os.stat(video_path)
+        return stat.st_size == self.source_size and stat.st_mtime == self.source_mtime
+
+
+def seek_capture(cap: cv2.VideoCapture, frame_idx: int, index: Optional[VideoIndex]) -> Tuple[int, Optional[np.ndarray]]:
+    # 预览解码和导出分段共用的定位：先到 frame_idx 之前最近的关键帧，按时间戳表确认实际落点；
+    # 落点越过目标或无法确认时退回从头顺序解码。返回 (下一次 read 将得到的帧号, 落点恰好是目标帧时已解码的这一帧)
+    keyframe = index.keyframe_before(frame_idx) if index is not None else None
+    if keyframe is None:
+        # 没有关键帧信息时只能交给 OpenCV 定位
+        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+        return frame_idx, None
+    
+    if keyframe > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, keyframe)
+        if not index.timestamps:
+            return keyframe, None
+        # 长 GOP 视频上 OpenCV 的 seek 落点可能不准，先 grab 一帧确认实际帧号
+        landed = index.frame_at(cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0) if cap.grab() else None
+        if landed is not None and landed < frame_idx:
+            return landed + 1, None
+        if landed == frame_idx:
+            ret, frame = cap.retrieve()
+            if ret:
+                return frame_idx + 1, frame
+    
+    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+    return 0, None
+
+
+def index_path(video_path: str, data_dir: str = "data") -> str:
+    video_name = os.path.splitext(os.path.basename(video_path))[0]
+    return os.path.join(data_dir, f"{video_name}.index.json")
+
+
+def _scan_packets(video_path: str, ffmpeg: str) -> Optional[VideoIndex]:
+    # -c copy 只解封装不解码，framecrc 每个视频包一行：流, dts, pts, 时长, 大小, 校验 [, F=标志]
+    # 没有 F= 字段时标志为默认的关键帧
+    result = subprocess.run(
+        [ffmpeg, '-v', 'error', '-i', video_path, '-map', '0:v:0', '-c', 'copy', '-f', 'framecrc', '-'],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        return None
+    
+    time_base = None
+    packets = []
+    for line in result.stdout.splitlines():
+        if line.startswith('#tb 0:'):
+            time_base = Fraction(line.split(':', 1)[1].strip())
+            continue
+        if line.startswith('#'):
+            continue
+        fields = [f.strip() for f in line.split(',')]
+        if len(fields) < 6 or fields[0] != '0':
+            continue
+        try:
+            pts = int(fields[2])
+        except ValueError:
+            continue
+        flags = int(fields[6].split('=')[1], 16) if len(fields) > 6 else 1
+        packets.append((pts, bool(flags & 1)))
+    
+    if time_base is None or not packets:
+        return None
+    
+    # 包按解码顺序输出，按 pts 排序后才是显示顺序的帧号
+    packets.sort()
+    first_pts = packets[0][0]
+    timestamps = [float((pts - first_pts) * time_base) for pts, _ in packets]
+    keyframes = [i for i, (_, key) in enumerate(packets) if key]
+    if len(timestamps) > 1:
+        fps = (len(timestamps) - 1) / (timestamps[-1] - timestamps[0]) if timestamps[-1] > timestamps[0] else 0.0
+    else:
+        fps = 0.0
+    return VideoIndex(frame_count=len(packets), fps=fps, keyframes=keyframes, timestamps=timestamps)
+
+
+def _scan_frames(video_path: str) -> VideoIndex:
+    # 没有 ffmpeg 时逐帧 grab 统计真实帧数和时间戳，拿不到关键帧信息
+    cap = cv2.VideoCapture(video_path)
+    timestamps = []
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        while cap.grab():
+            timestamps.append(cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0)
+    finally:
+        cap.release()
+    return VideoIndex(frame_count=len(timestamps), fps=fps, timestamps=timestamps)
+
+
+def build_index(video_path: str) -> VideoIndex:
+    ffmpeg = find_ffmpeg()
+    index = _scan_packets(video_path, ffmpeg) if ffmpeg else None
+    if index is None:
+        index = _scan_frames(video_path)
+    
+    stat = os.stat(video_path)
+    index.source_size = stat.st_size
+    index.source_mtime = stat.st_mtime
+    return index
+
+
+def load_index(video_path: str, data_dir: str = "data", rebuild: bool = True) -> Optional[VideoIndex]:
+    path = index_path(video_path, data_dir)
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                index = VideoIndex(**json.load(f))
+            if index.matches(video_path):
+                return index
+        except (OSError, ValueError, TypeError):
+            pass
+    
+    if not rebuild:
+        return None
+    
+    index = build_index(video_path)
+    os.makedirs(data_dir, exist_ok=True)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(asdict(index), f)
+    os.replace(temp_path, path)
+    return index
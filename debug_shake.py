@@ -11,7 +11,7 @@ for i in range(31):
     engine.update(engine.frame_time)
 
 print(f"\n更新 31 帧后 (t = {engine.current_time}):")
-print(f"  processed_event_indices = {engine.processed_event_indices}")
+print(f"  event_cursor = {engine.event_cursor}")
 print(f"  current_shake = {engine.current_shake}")
 print(f"  P1 HP: Display={engine.p1_hp_display:.1f}, Target={engine.p1_hp_target:.1f}")
 print(f"  P2 HP: Display={engine.p2_hp_display:.1f}, Target={engine.p2_hp_target:.1f}")
@@ -0,0 +1,175 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+from core.engine import FightStateEngine
+from core.events import EventStore
+from core.match_store import MatchStore, match_exists
+from core.pipeline import StageStats
+from core.processor import probe_indexed, render_source_hash, render_video, segment_cache_dir
+from core.renderer import SF6Renderer
+
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+
+
+def find_matches(videos_dir: str, data_dir: str) -> List[Tuple[str, str]]:
+    matches = []
+    for filename in sorted(os.listdir(videos_dir)):
+        if not filename.lower().endswith(VIDEO_EXTENSIONS):
+            continue
+        video_name = os.path.splitext(filename)[0]
+        json_path = os.path.join(data_dir, f"{video_name}.json")
+        if match_exists(json_path):
+            matches.append((os.path.join(videos_dir, filename), json_path))
+    return matches
+
+
+def load_match(json_path: str) -> Tuple[EventStore, str, str]:
+    # 经由 MatchStore 读取，包含二进制快照和尚未合并的操作日志
+    store = MatchStore(json_path)
+    events = store.load()
+    return events, store.meta.get('p1_id', "P1"), store.meta.get('p2_id', "P2")
+
+
+def file_sha256(path: str, chunk_size: int = 4 * 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_sidecar(output_path: str) -> Dict:
+    try:
+        with open(output_path + '.json', 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def video_hash(video_path: str, sidecar: Dict) -> str:
+    # 视频文件大小和修改时间都没变时沿用上次的哈希，避免每次都完整读一遍大文件
+    stat = os.stat(video_path)
+    cached = sidecar.get('video', {})
+    if cached.get('size') == stat.st_size and cached.get('mtime') == stat.st_mtime and cached.get('sha256'):
+        return cached['sha256']
+    return file_sha256(video_path)
+
+
+def input_hash(video_sha256: str, events: EventStore, p1_id: str, p2_id: str, code_hash: str) -> str:
+    # 对事件内容而不是文件字节取哈希：快照格式、日志是否合并都不影响结果
+    digest = hashlib.sha256()
+    digest.update(video_sha256.encode())
+    for column in (events.timestamps, events.players, events.damages, events.supers):
+        digest.update(column.tobytes())
+    digest.update(f"{p1_id}\0{p2_id}\0{code_hash}".encode())
+    return digest.hexdigest()
+
+
+def render_match(video_path: str, events: EventStore, output_path: str, workers: int, p1_id: str, p2_id: str,
+                 cache_dir: Optional[str] = None, data_dir: str = "data") -> Tuple[int, Dict[str, StageStats]]:
+    (total_frames, fps, width, height), index = probe_indexed(video_path, data_dir)
+    
+    engine = FightStateEngine(fps=fps)
+    engine.set_events(events)
+    renderer = SF6Renderer(width=width, height=height)
+    
+    stats = {}
+    render_video(video_path, engine, renderer, output_path, p1_id, p2_id, workers=workers, cache_dir=cache_dir,
+                 stats_callback=stats.update, index=index)
+    return total_frames, stats
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="批量渲染 videos/ 下所有已标注的比赛视频")
+    parser.add_argument('--videos', default="videos", help="视频目录")
+    parser.add_argument('--data', default="data", help="事件 JSON 目录")
+    parser.add_argument('--output', default="output", help="输出目录")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="渲染进程数")
+    parser.add_argument('--p1', default=None, help="P1 角色名（默认读取 JSON 中的 p1_id，否则为 P1）")
+    parser.add_argument('--p2', default=None, help="P2 角色名（默认读取 JSON 中的 p2_id，否则为 P2）")
+    parser.add_argument('--force', action='store_true', help="忽略哈希，全部重新渲染")
+    parser.add_argument('--no-segment-cache', action='store_true', help="不使用分段缓存（默认只重渲染 HUD 状态有变化的分段）")
+    args = parser.parse_args(argv)
+    
+    if not os.path.isdir(args.videos):
+        print(f"视频目录不存在: {args.videos}", file=sys.stderr)
+        return 1
+    
+    matches = find_matches(args.videos, args.data)
+    if not matches:
+        print("没有找到带事件 JSON 的视频")
+        return 0
+    
+    os.makedirs(args.output, exist_ok=True)
+    code_hash = render_source_hash()
+    
+    rendered, skipped, failed = [], [], []
+    batch_start = time.perf_counter()
+    
+    for video_path, json_path in matches:
+        video_name = os.path.splitext(os.path.basename(video_path))[0]
+        output_path = os.path.join(args.output, f"{video_name}_rendered.mp4")
+        
+        sidecar = read_sidecar(output_path)
+        events, json_p1, json_p2 = load_match(json_path)
+        p1_id, p2_id = args.p1 or json_p1, args.p2 or json_p2
+        video_sha256 = video_hash(video_path, sidecar)
+        current_hash = input_hash(video_sha256, events, p1_id, p2_id, code_hash)
+        
+        if not args.force and os.path.exists(output_path) and sidecar.get('input_hash') == current_hash:
+            print(f"[跳过] {video_name}: 输出已是最新")
+            skipped.append(video_name)
+            continue
+        
+        print(f"[渲染] {video_name} ...", flush=True)
+        start = time.perf_counter()
+        try:
+            cache_dir = None if args.no_segment_cache else segment_cache_dir(args.output, video_name)
+            frames, stats = render_match(video_path, events, output_path, args.workers, p1_id, p2_id, cache_dir,
+                                         data_dir=args.data)
+        except Exception as e:
+            print(f"[失败] {video_name}: {e}", file=sys.stderr)
+            failed.append(video_name)
+            continue
+        elapsed = time.perf_counter() - start
+        
+        stat = os.stat(video_path)
+        with open(output_path + '.json', 'w', encoding='utf-8') as f:
+            json.dump({
+                'input_hash': current_hash,
+                'video': {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': video_sha256},
+                'frames': frames,
+                'seconds': elapsed
+            }, f, indent=2)
+        
+        summary = f"[完成] {video_name}: {frames} 帧, {elapsed:.1f} 秒, {frames / elapsed:.1f} FPS"
+        composite = stats.get('composite')
+        if composite is not None and composite.cache_hits + composite.cache_misses > 0:
+            summary += f", HUD 复用 {composite.hit_ratio:.0%}"
+        decode = stats.get('decode')
+        if decode is not None and decode.missing:
+            summary += f", {decode.missing} 帧读取失败已用灰帧补齐"
+        print(summary)
+        rendered.append((video_name, frames, elapsed))
+    
+    total_elapsed = time.perf_counter() - batch_start
+    total_frames = sum(frames for _, frames, _ in rendered)
+    print()
+    print(f"共 {len(matches)} 个视频: 渲染 {len(rendered)}, 跳过 {len(skipped)}, 失败 {len(failed)}")
+    if rendered:
+        print(f"渲染 {total_frames} 帧, 用时 {total_elapsed:.1f} 秒, 平均 {total_frames / total_elapsed:.1f} FPS")
+    
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())